@@ -0,0 +1,295 @@
+# archive_store.py — колоночное хранилище архивных CSV
+
+import contextlib
+import os
+import json
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from downsampling import trim_time_range
+
+
+ARCHIVE_ENCODING = "ISO-8859-2"
+ARCHIVE_SEP = ";"
+SERVICE_COLUMNS = ("DATE", "TIME", "datetime")
+
+STORE_VERSION = 2
+STORE_META = "meta.json"
+STORE_TIMESTAMPS = "datetime.npy"
+# Сколько секунд хранить неактуальные версии данных (их может дочитывать параллельный запрос)
+STORE_GRACE_SECONDS = 300
+
+
+# =============================================================================
+# ЧТЕНИЕ CSV
+# =============================================================================
+
+def read_archive_header(filepath: str) -> List[str]:
+    """Возвращает имена сигналов из заголовка архивного CSV"""
+    df_header = pd.read_csv(filepath, nrows=0, encoding=ARCHIVE_ENCODING, sep=ARCHIVE_SEP)
+    return [c for c in df_header.columns.tolist() if c not in SERVICE_COLUMNS]
+
+
+def _parse_datetime(df: pd.DataFrame) -> pd.Series:
+    time_part = df["TIME"].str.replace(",", ".", regex=False).str.split(".").str[0]
+    combined = df["DATE"] + " " + time_part
+    return pd.to_datetime(combined, format="%d.%m.%Y %H:%M:%S", errors="coerce")
+
+
+def read_archive_time_range(filepath: str) -> Tuple[Optional[int], Optional[int]]:
+    """Мин./макс. метка времени файла в наносекундах (читаются только DATE и TIME)"""
+    df = pd.read_csv(
+        filepath,
+        encoding=ARCHIVE_ENCODING,
+        sep=ARCHIVE_SEP,
+        usecols=["DATE", "TIME"],
+        dtype={"DATE": str, "TIME": str},
+    )
+    dt = _parse_datetime(df).dropna()
+    if dt.empty:
+        return None, None
+    return _range_ns(dt.min()), _range_ns(dt.max())
+
+
+def read_archive_csv(filepath: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Читает архивный CSV: колонка datetime + сигналы, отсортировано по времени.
+    columns — если задан, читаются только DATE, TIME и эти сигналы.
+    Значения с десятичной запятой разбираются парсером сразу в float.
+    """
+    usecols = None
+    if columns is not None:
+        wanted = set(columns) | {"DATE", "TIME"}
+        usecols = lambda c: c in wanted
+
+    df = pd.read_csv(
+        filepath,
+        encoding=ARCHIVE_ENCODING,
+        sep=ARCHIVE_SEP,
+        usecols=usecols,
+        decimal=",",
+        dtype={"DATE": str, "TIME": str},
+    )
+
+    df["datetime"] = _parse_datetime(df)
+    df = df.dropna(subset=["datetime"])
+    df = df.drop(["DATE", "TIME"], axis=1)
+    df = df.sort_values("datetime", kind="stable")
+    return df
+
+
+def _to_float64(series: pd.Series) -> np.ndarray:
+    if series.dtype.kind not in ("i", "u", "f"):
+        text = series.astype(str).str.replace(",", ".", regex=False)
+        series = pd.to_numeric(text, errors="coerce")
+    return series.to_numpy(dtype=np.float64)
+
+
+# =============================================================================
+# КОЛОНОЧНОЕ ХРАНИЛИЩЕ
+# =============================================================================
+#
+# Для каждого CSV создаётся каталог <cache>/<имя файла>/:
+#   meta.json          — версия, mtime исходника, число строк, колонка -> файл,
+#                        data — имя каталога с данными
+#   v-<id>/datetime.npy — int64, наносекунды, по возрастанию
+#   v-<id>/c<N>.npy     — float64 значения сигнала
+# Хранилище считается актуальным, пока mtime в meta.json совпадает с mtime CSV.
+# Каталоги данных не изменяются после записи: новая версия пишется рядом,
+# meta.json подменяется атомарно (os.replace), старые версии удаляются позже.
+# Поэтому читатель (в том числе в другом процессе), уже прочитавший meta.json,
+# не увидит ни пустого, ни наполовину записанного каталога.
+
+def resolve_cache_folder(folder: str, base_dir: str) -> str:
+    return folder if os.path.isabs(folder) else os.path.normpath(os.path.join(base_dir, folder))
+
+
+def _store_dir(cache_folder: str, filepath: str) -> str:
+    return os.path.join(cache_folder, os.path.basename(filepath))
+
+
+def _read_meta(store_dir: str) -> Optional[Dict]:
+    meta_path = os.path.join(store_dir, STORE_META)
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _is_fresh(meta: Optional[Dict], mtime: float) -> bool:
+    return bool(meta) and meta.get("version") == STORE_VERSION and meta.get("mtime") == mtime
+
+
+def ingest_archive_file(filepath: str, cache_folder: str) -> Dict:
+    """Конвертирует один CSV в колоночное хранилище, возвращает meta"""
+    mtime = os.path.getmtime(filepath)
+    df = read_archive_csv(filepath)
+
+    store_dir = _store_dir(cache_folder, filepath)
+    os.makedirs(store_dir, exist_ok=True)
+    previous = _read_meta(store_dir)
+    data_name = f"v-{uuid.uuid4().hex[:12]}"
+    tmp_dir = os.path.join(store_dir, f"{data_name}.tmp")
+    tmp_meta = os.path.join(store_dir, f"{STORE_META}.tmp-{uuid.uuid4().hex[:8]}")
+    os.makedirs(tmp_dir)
+
+    try:
+        timestamps = df["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        np.save(os.path.join(tmp_dir, STORE_TIMESTAMPS), timestamps)
+
+        columns = {}
+        signal_columns = [c for c in df.columns if c not in SERVICE_COLUMNS]
+        for i, name in enumerate(signal_columns):
+            col_file = f"c{i}.npy"
+            np.save(os.path.join(tmp_dir, col_file), _to_float64(df[name]))
+            columns[str(name)] = col_file
+
+        meta = {
+            "version": STORE_VERSION,
+            "source": os.path.basename(filepath),
+            "mtime": mtime,
+            "rows": int(len(df)),
+            "columns": columns,
+            "data": data_name,
+        }
+        os.replace(tmp_dir, os.path.join(store_dir, data_name))
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, os.path.join(store_dir, STORE_META))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        with contextlib.suppress(OSError):
+            os.remove(tmp_meta)
+        raise
+
+    keep = {data_name, (previous or {}).get("data")}
+    _prune_versions(store_dir, keep)
+
+    print(f"  ✓ ingested {os.path.basename(filepath)}: {len(columns)} signals, {len(df)} rows")
+    return meta
+
+
+def _prune_versions(store_dir: str, keep: set):
+    """Удаляет неактуальные версии данных старше STORE_GRACE_SECONDS (и файлы прежней раскладки)"""
+    deadline = time.time() - STORE_GRACE_SECONDS
+    try:
+        entries = list(os.scandir(store_dir))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name == STORE_META or entry.name in keep:
+            continue
+        try:
+            if entry.stat().st_mtime > deadline:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _data_dir(store_dir: str, meta: Dict) -> str:
+    return os.path.join(store_dir, meta["data"])
+
+
+def ensure_archive_file(filepath: str, cache_folder: str) -> Dict:
+    """Возвращает meta актуального хранилища, при необходимости перестраивая его"""
+    store_dir = _store_dir(cache_folder, filepath)
+    meta = _read_meta(store_dir)
+    if _is_fresh(meta, os.path.getmtime(filepath)) and os.path.isdir(_data_dir(store_dir, meta)):
+        return meta
+    os.makedirs(cache_folder, exist_ok=True)
+    return ingest_archive_file(filepath, cache_folder)
+
+
+def _range_ns(value: Optional[pd.Timestamp]) -> Optional[int]:
+    return None if value is None else int(pd.Timestamp(value).as_unit("ns").value)
+
+
+def load_signals_from_store(
+    filepath: str,
+    signal_names: List[str],
+    cache_folder: str,
+    start: Optional[pd.Timestamp] = None,
+    end: Optional[pd.Timestamp] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Читает из хранилища только запрошенные колонки (и строки start..end) одного файла"""
+    meta = ensure_archive_file(filepath, cache_folder)
+    store_dir = _store_dir(cache_folder, filepath)
+
+    wanted = [name for name in signal_names if name in meta["columns"]]
+    if not wanted:
+        return {}
+
+    data_dir = _data_dir(store_dir, meta)
+    timestamps = np.load(os.path.join(data_dir, STORE_TIMESTAMPS), mmap_mode="r")
+    start_ns, end_ns = _range_ns(start), _range_ns(end)
+    lo = 0 if start_ns is None else int(np.searchsorted(timestamps, start_ns, side="left"))
+    hi = len(timestamps) if end_ns is None else int(np.searchsorted(timestamps, end_ns, side="right"))
+    dt = pd.to_datetime(np.array(timestamps[lo:hi]))
+
+    out = {}
+    for name in wanted:
+        values = np.load(os.path.join(data_dir, meta["columns"][name]), mmap_mode="r")
+        out[name] = pd.DataFrame({"datetime": dt, "value": np.array(values[lo:hi])})
+    return out
+
+
+def load_archive_file(
+    filepath: str,
+    signal_names: List[str],
+    cache_folder: Optional[str] = None,
+    start: Optional[pd.Timestamp] = None,
+    end: Optional[pd.Timestamp] = None,
+) -> Tuple[str, Dict[str, pd.DataFrame], float]:
+    """
+    Загружает сигналы одного архивного файла (из хранилища или CSV).
+    Функция верхнего уровня — выполняется в пуле процессов/потоков.
+    Возвращает (filepath, {signal: DataFrame[datetime, value]}, время в секундах).
+    """
+    started = time.perf_counter()
+    if cache_folder:
+        found = load_signals_from_store(filepath, signal_names, cache_folder, start, end)
+    else:
+        df = trim_time_range(read_archive_csv(filepath, columns=signal_names), start, end)
+        found = {}
+        for name in signal_names:
+            if name in df.columns:
+                found[name] = pd.DataFrame({"datetime": df["datetime"].to_numpy(), "value": df[name].to_numpy()})
+    return filepath, found, time.perf_counter() - started
+
+
+def merge_signal_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Склеивает куски одного сигнала из разных файлов (дубли времени — первый)"""
+    if len(frames) == 1:
+        return frames[0]
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.sort_values("datetime", kind="stable")
+    merged = merged.drop_duplicates(subset="datetime", keep="first")
+    return merged.reset_index(drop=True)
+
+
+def prune_archive_store(cache_folder: str, archive_files: List[str]) -> int:
+    """Удаляет каталоги хранилища для CSV, которых больше нет в архиве"""
+    if not os.path.isdir(cache_folder):
+        return 0
+    keep = {os.path.basename(p) for p in archive_files}
+    removed = 0
+    for name in os.listdir(cache_folder):
+        if name in keep or ".tmp-" in name:
+            continue
+        shutil.rmtree(os.path.join(cache_folder, name), ignore_errors=True)
+        removed += 1
+    if removed:
+        print(f"[INFO] Archive store: removed {removed} stale entries")
+    return removed
@@ -0,0 +1,503 @@
+# code_parser.py — разбор языка CODE в типизированное AST и компиляция в план вычисления
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple, Union
+
+
+class CodeSyntaxError(Exception):
+    """Синтаксическая ошибка в выражении CODE."""
+
+
+# =============================================================================
+# AST
+# =============================================================================
+
+@dataclass(frozen=True)
+class Num:
+    value: float
+
+
+@dataclass(frozen=True)
+class Str:
+    value: str
+
+
+@dataclass(frozen=True)
+class Name:
+    """Идентификатор: сигнал, таблица, X/Y или np.<attr> — разрешается при связывании"""
+    name: str
+
+
+@dataclass(frozen=True)
+class Call:
+    func: str
+    args: Tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Unary:
+    op: str          # "-", "+", "NOT"
+    operand: "Node"
+
+
+@dataclass(frozen=True)
+class BinOp:
+    op: str          # "+", "-", "*", "/", "%", "**"
+    left: "Node"
+    right: "Node"
+
+
+@dataclass(frozen=True)
+class Compare:
+    op: str          # "==", "!=", "<", ">", "<=", ">="
+    left: "Node"
+    right: "Node"
+
+
+@dataclass(frozen=True)
+class Logic:
+    op: str          # "AND", "OR"
+    left: "Node"
+    right: "Node"
+
+
+Node = Union[Num, Str, Name, Call, Unary, BinOp, Compare, Logic]
+
+
+def iter_nodes(node: Node):
+    """Обход дерева в глубину (сначала узел, потом потомки)"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        if isinstance(current, Call):
+            stack.extend(reversed(current.args))
+        elif isinstance(current, Unary):
+            stack.append(current.operand)
+        elif isinstance(current, (BinOp, Compare, Logic)):
+            stack.append(current.right)
+            stack.append(current.left)
+
+
+def referenced_names(node: Node) -> List[str]:
+    """Имена идентификаторов в порядке первого появления"""
+    seen = {}
+    for n in iter_nodes(node):
+        if isinstance(n, Name):
+            seen.setdefault(n.name, None)
+    return list(seen)
+
+
+# =============================================================================
+# ЛЕКСЕР
+# =============================================================================
+#
+# Имя сигнала — любая последовательность символов, кроме пробелов и
+# операторов, поэтому работают теги вида 10MAA50CP001§§XQ01. Имена,
+# содержащие символы-разделители (пробел, "-", ...), передаются в
+# special_names и распознаются целиком раньше остальных правил.
+
+DELIMITERS = set(" \t\r\n()+-*/%<>=!,&|~'\"^")
+
+_NUMBER_RE = re.compile(r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_OPERATORS = ("**", "<=", ">=", "<>", "!=", "==", "=", "<", ">", "+", "-", "*", "/", "%", "&", "|", "~", "(", ")", ",")
+_KEYWORDS = {"AND", "OR", "NOT"}
+
+# (kind, value, position)
+Token = Tuple[str, object, int]
+
+
+def needs_special_name(name: str) -> bool:
+    """Имя нельзя разобрать общим правилом идентификатора"""
+    if not name or name[0] == "." or _NUMBER_RE.fullmatch(name):
+        return True
+    return any(ch in DELIMITERS for ch in name)
+
+
+def tokenize(text: str, special_names: Tuple[str, ...] = ()) -> List[Token]:
+    tokens: List[Token] = []
+    specials = sorted(special_names, key=len, reverse=True)
+    i, n = 0, len(text)
+
+    while i < n:
+        ch = text[i]
+
+        if ch in " \t\r\n":
+            i += 1
+            continue
+
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            if end < 0:
+                raise CodeSyntaxError(f"Незакрытый комментарий (позиция {i})")
+            i = end + 2
+            continue
+
+        matched = next((name for name in specials if text.startswith(name, i)), None)
+        if matched:
+            tokens.append(("name", matched, i))
+            i += len(matched)
+            continue
+
+        if ch in ("'", '"'):
+            j = i + 1
+            buf = []
+            while j < n and text[j] != ch:
+                if text[j] == "\\" and j + 1 < n:
+                    j += 1
+                buf.append(text[j])
+                j += 1
+            if j >= n:
+                raise CodeSyntaxError(f"Незакрытая строка (позиция {i})")
+            tokens.append(("str", "".join(buf), i))
+            i = j + 1
+            continue
+
+        m = _NUMBER_RE.match(text, i)
+        if m and (m.end() >= n or text[m.end()] in DELIMITERS):
+            tokens.append(("num", float(m.group()), i))
+            i = m.end()
+            continue
+
+        op = next((o for o in _OPERATORS if text.startswith(o, i)), None)
+        if op:
+            tokens.append(("op", op, i))
+            i += len(op)
+            continue
+
+        if ch in DELIMITERS:
+            raise CodeSyntaxError(f"Неожиданный символ '{ch}' (позиция {i})")
+
+        j = i
+        while j < n and text[j] not in DELIMITERS and not text.startswith("/*", j):
+            j += 1
+        word = text[i:j]
+        if word.upper() in _KEYWORDS:
+            tokens.append(("op", word.upper(), i))
+        else:
+            tokens.append(("name", word, i))
+        i = j
+
+    tokens.append(("end", None, n))
+    return tokens
+
+
+# =============================================================================
+# ПАРСЕР (рекурсивный спуск)
+# =============================================================================
+#
+# Приоритеты (от низшего): OR, AND, NOT, сравнения, + -, * / %, унарный -, **.
+# "=" и "==" — равенство, "<>" и "!=" — неравенство, & | ~ — синонимы AND OR NOT.
+
+_COMPARE_OPS = {"=": "==", "==": "==", "<>": "!=", "!=": "!=", "<": "<", ">": ">", "<=": "<=", ">=": ">="}
+
+
+class _Parser:
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.pos]
+
+    def advance(self) -> Token:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def accept(self, *ops) -> str | None:
+        kind, value, _ = self.peek()
+        if kind == "op" and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def expect(self, op: str):
+        if not self.accept(op):
+            kind, value, pos = self.peek()
+            found = "конец выражения" if kind == "end" else f"'{value}'"
+            raise CodeSyntaxError(f"Ожидалось '{op}', найдено {found} (позиция {pos})")
+
+    def parse(self) -> Node:
+        if self.peek()[0] == "end":
+            raise CodeSyntaxError("Строка CODE пуста.")
+        node = self.parse_or()
+        kind, value, pos = self.peek()
+        if kind != "end":
+            raise CodeSyntaxError(f"Лишний текст после выражения: '{value}' (позиция {pos})")
+        return node
+
+    def parse_or(self) -> Node:
+        node = self.parse_and()
+        while self.accept("OR", "|"):
+            node = Logic("OR", node, self.parse_and())
+        return node
+
+    def parse_and(self) -> Node:
+        node = self.parse_not()
+        while self.accept("AND", "&"):
+            node = Logic("AND", node, self.parse_not())
+        return node
+
+    def parse_not(self) -> Node:
+        if self.accept("NOT", "~"):
+            return Unary("NOT", self.parse_not())
+        return self.parse_compare()
+
+    def parse_compare(self) -> Node:
+        left = self.parse_additive()
+        result = None
+        # цепочки a < b < c — как в Python: (a < b) AND (b < c)
+        while True:
+            op = self.accept(*_COMPARE_OPS)
+            if not op:
+                break
+            right = self.parse_additive()
+            cmp = Compare(_COMPARE_OPS[op], left, right)
+            result = cmp if result is None else Logic("AND", result, cmp)
+            left = right
+        return left if result is None else result
+
+    def parse_additive(self) -> Node:
+        node = self.parse_term()
+        while True:
+            op = self.accept("+", "-")
+            if not op:
+                return node
+            node = BinOp(op, node, self.parse_term())
+
+    def parse_term(self) -> Node:
+        node = self.parse_unary()
+        while True:
+            op = self.accept("*", "/", "%")
+            if not op:
+                return node
+            node = BinOp(op, node, self.parse_unary())
+
+    def parse_unary(self) -> Node:
+        op = self.accept("-", "+")
+        if op:
+            operand = self.parse_unary()
+            if op == "-" and isinstance(operand, Num):
+                return Num(-operand.value)
+            return operand if op == "+" else Unary("-", operand)
+        return self.parse_power()
+
+    def parse_power(self) -> Node:
+        node = self.parse_atom()
+        if self.accept("**"):
+            return BinOp("**", node, self.parse_unary())
+        return node
+
+    def parse_atom(self) -> Node:
+        kind, value, pos = self.advance()
+        if kind == "num":
+            return Num(value)
+        if kind == "str":
+            return Str(value)
+        if kind == "name":
+            if self.accept("("):
+                args = []
+                if not self.accept(")"):
+                    while True:
+                        args.append(self.parse_or())
+                        if self.accept(")"):
+                            break
+                        self.expect(",")
+                return Call(value, tuple(args))
+            return Name(value)
+        if kind == "op" and value == "(":
+            node = self.parse_or()
+            self.expect(")")
+            return node
+        found = "конец выражения" if kind == "end" else f"'{value}'"
+        raise CodeSyntaxError(f"Неожиданный {found} (позиция {pos})")
+
+
+@lru_cache(maxsize=1024)
+def parse_code(text: str, special_names: Tuple[str, ...] = ()) -> Node:
+    """Разбирает CODE в AST. Результат кэшируется по тексту формулы."""
+    return _Parser(tokenize(text, special_names)).parse()
+
+
+# =============================================================================
+# ОБЩИЕ ПОДВЫРАЖЕНИЯ
+# =============================================================================
+#
+# После подстановки шаблонов (h, s, t, ...) одни и те же подвыражения вида
+# POW((540.0 / (t + 273.15)), k) повторяются десятки раз. Дерево сворачивается
+# в DAG (hash-consing): одинаковые поддеревья получают один номер, а узлы,
+# на которые ссылаются больше одного раза, вычисляются однажды во временную
+# переменную. Все функции CODE чистые, поэтому это не меняет результат.
+
+def _node_key(node: Node, child_ids: Tuple[int, ...]) -> tuple:
+    if isinstance(node, Num):
+        return ("num", repr(node.value))
+    if isinstance(node, Str):
+        return ("str", node.value)
+    if isinstance(node, Name):
+        return ("name", node.name)
+    if isinstance(node, Call):
+        return ("call", node.func) + child_ids
+    return (type(node).__name__, node.op) + child_ids
+
+
+def _children(node: Node) -> Tuple[Node, ...]:
+    if isinstance(node, Call):
+        return node.args
+    if isinstance(node, Unary):
+        return (node.operand,)
+    if isinstance(node, (BinOp, Compare, Logic)):
+        return (node.left, node.right)
+    return ()
+
+
+class NodeDag:
+    """Дерево, свёрнутое по одинаковым поддеревьям"""
+
+    def __init__(self, tree: Node):
+        self.nodes: List[Node] = []               # номер -> первый встреченный узел
+        self.children: List[Tuple[int, ...]] = []
+        self.refs: List[int] = []                 # число ссылок на узел в DAG
+        self.tree_size = 0
+        keys: Dict[tuple, int] = {}
+
+        def intern(node: Node) -> int:
+            self.tree_size += 1
+            child_ids = tuple(intern(c) for c in _children(node))
+            key = _node_key(node, child_ids)
+            uid = keys.get(key)
+            if uid is None:
+                uid = keys[key] = len(self.nodes)
+                self.nodes.append(node)
+                self.children.append(child_ids)
+                self.refs.append(0)
+                for c in child_ids:
+                    self.refs[c] += 1
+            return uid
+
+        self.root = intern(tree)
+        self.refs[self.root] += 1
+
+    def is_shared(self, uid: int) -> bool:
+        return self.refs[uid] > 1 and not isinstance(self.nodes[uid], (Num, Str, Name))
+
+
+# =============================================================================
+# КОМПИЛЯЦИЯ В ПЛАН
+# =============================================================================
+#
+# AST переводится в исходник Python-функции над массивами NumPy:
+#     def _plan(S, F):
+#         s0, s1 = S
+#         f0, f1 = F
+#         t0 = (s0 + 273.15)
+#         return f0((540.0 / t0), 2.0) + f0((540.0 / t0), 3.0)
+# S — массивы сигналов, F — функции CODE, tN — общие подвыражения.
+# Исходник компилируется один раз.
+
+# Виды связывания идентификатора
+BIND_SIGNAL = "signal"
+BIND_STRING = "string"    # имя таблицы, X, Y
+BIND_CONST = "const"      # np.<константа>, TRUE/FALSE
+
+
+@dataclass(frozen=True)
+class CodePlan:
+    fn: Callable
+    signals: Tuple[str, ...]
+    functions: Tuple[str, ...]
+    source: str
+    nodes_before: int     # узлов в исходном дереве
+    nodes_after: int      # узлов после свёртки общих подвыражений
+    temporaries: int
+
+
+def emit_expression(
+    tree: Node,
+    name_expr: Callable[[str], str],
+    func_var: Callable[[str], str],
+) -> Tuple[List[str], str, NodeDag]:
+    """
+    Python-выражение дерева: общие подвыражения выносятся во временные tN.
+    name_expr(имя) и func_var(имя функции) возвращают текст подстановки.
+    Возвращает (присваивания "tN = ...", итоговое выражение, DAG).
+    """
+    dag = NodeDag(tree)
+    temps: Dict[int, str] = {}
+    assignments: List[str] = []
+
+    def emit(uid: int) -> str:
+        if uid in temps:
+            return temps[uid]
+        node = dag.nodes[uid]
+        args = [emit(c) for c in dag.children[uid]]
+
+        if isinstance(node, (Num, Str)):
+            return repr(node.value)
+        if isinstance(node, Name):
+            return name_expr(node.name)
+
+        if isinstance(node, Call):
+            expr = f"{func_var(node.func)}({', '.join(args)})"
+        elif isinstance(node, Unary):
+            expr = f"{func_var('__not__')}({args[0]})" if node.op == "NOT" else f"(-{args[0]})"
+        elif isinstance(node, (BinOp, Compare)):
+            expr = f"({args[0]} {node.op} {args[1]})"
+        elif isinstance(node, Logic):
+            fn = "__and__" if node.op == "AND" else "__or__"
+            expr = f"{func_var(fn)}({args[0]}, {args[1]})"
+        else:
+            raise CodeSyntaxError(f"Неизвестный узел AST: {node!r}")
+
+        if dag.is_shared(uid):
+            temps[uid] = f"t{len(temps)}"
+            assignments.append(f"{temps[uid]} = {expr}")
+            return temps[uid]
+        return expr
+
+    return assignments, emit(dag.root), dag
+
+
+def compile_plan(tree: Node, bindings: Tuple[Tuple[str, str, object], ...]) -> CodePlan:
+    """
+    bindings — ((имя, вид, значение), ...) для каждого Name дерева.
+    Для BIND_SIGNAL значение — имя колонки, для BIND_STRING — строка,
+    для BIND_CONST — число.
+    """
+    bind_map = {name: (kind, value) for name, kind, value in bindings}
+    signals: Dict[str, str] = {}
+    functions: Dict[str, str] = {}
+
+    def func_var(name: str) -> str:
+        return functions.setdefault(name, f"f{len(functions)}")
+
+    def name_expr(name: str) -> str:
+        kind, value = bind_map[name]
+        if kind == BIND_SIGNAL:
+            return signals.setdefault(value, f"s{len(signals)}")
+        return repr(value)
+
+    assignments, body, dag = emit_expression(tree, name_expr, func_var)
+    lines = ["def _plan(S, F):"]
+    if signals:
+        lines.append(f"    {', '.join(signals.values())}, = S")
+    if functions:
+        lines.append(f"    {', '.join(functions.values())}, = F")
+    lines.extend(f"    {line}" for line in assignments)
+    lines.append(f"    return {body}")
+    source = "\n".join(lines)
+
+    namespace: Dict[str, object] = {}
+    exec(compile(source, "<code_plan>", "exec"), {"__builtins__": {}}, namespace)
+    return CodePlan(
+        fn=namespace["_plan"],
+        signals=tuple(signals),
+        functions=tuple(functions),
+        source=source,
+        nodes_before=dag.tree_size,
+        nodes_after=len(dag.nodes),
+        temporaries=len(assignments),
+    )
@@ -1,16 +1,146 @@
 #code_signal.py
 
-import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Tuple, Dict
 
 import numpy as np
 import pandas as pd
 
-TABLE_REGISTRY: Dict[str, pd.DataFrame] = {}
+from code_parser import (
+    BIND_CONST,
+    BIND_SIGNAL,
+    BIND_STRING,
+    CodePlan,
+    CodeSyntaxError,
+    Str,
+    compile_plan,
+    iter_nodes,
+    needs_special_name,
+    parse_code,
+    referenced_names,
+)
+from iapws97 import STEAM_FUNCTIONS, apply_template_ranges
+
+@dataclass(frozen=True)
+class TableSet:
+    """
+    Зарегистрированные таблицы GETPOINT: исходные кадры, подготовленные кривые и ошибки.
+    Набор не изменяется после создания: register_tables собирает новый и подменяет
+    ссылку одним присваиванием, поэтому расчёт в другом потоке, взявший набор через
+    registered_tables(), видит либо старые, либо новые таблицы целиком.
+    """
+    frames: Dict[str, pd.DataFrame]
+    curves: Dict[str, "TableCurves"]
+    errors: Dict[str, str]
+
+
+_TABLES = TableSet({}, {}, {})
+
+
+def registered_tables() -> TableSet:
+    """Текущий набор таблиц (берётся один раз на расчёт формулы)"""
+    return _TABLES
+
 
 def register_tables(tables: Dict[str, pd.DataFrame]):
-    TABLE_REGISTRY.clear()
-    TABLE_REGISTRY.update(tables or {})
+    global _TABLES
+    tables = dict(tables or {})
+    curves, errors = {}, {}
+    for name, df in tables.items():
+        try:
+            curves[name] = prepare_table(df)
+        except CodeEvaluationError as e:
+            errors[name] = f"ошибка таблицы '{name}': {e}"
+            print(f"[WARN] GETPOINT: table '{name}' skipped: {e}")
+            continue
+        if not curves[name].monotonic:
+            print(f"[WARN] GETPOINT: table '{name}' is not monotonic, Y -> X lookup is ambiguous")
+
+    _TABLES = TableSet(tables, curves, errors)
+
+
+def register_templates(templates: List[Dict]):
+    """Диапазоны аргументов встроенных функций пара (h, s, t, ts, ps) из шаблонов"""
+    apply_template_ranges(templates)
+
+
+NS_PER_MINUTE = 60_000_000_000
+
+
+def rolling_slope(values: pd.Series, period: int, times: np.ndarray | None = None) -> np.ndarray:
+    """
+    Наклон МНК y = a*x + b в скользящем окне, как у HISTORYGRADIENT.
+    times=None: окно — `period` последних точек, x — номер непустой точки;
+    times — метки времени в нс (по возрастанию): окно (t - period мин, t], x — время в минутах.
+    NaN пропускаются, нужно минимум 2 непустые точки в окне.
+
+    Суммы для МНК считаются не по всему ряду, а нарастающим итогом внутри областей
+    из двух соседних блоков длиной в окно (по точкам или по времени), от опорной точки
+    начала области: окно целиком лежит в области своей последней точки, поэтому
+    x - x_ref и y - y_ref не больше пары окон, и погрешность не растёт ни с
+    величиной x (время в минутах от эпохи), ни с длиной ряда.
+    """
+    y = values.to_numpy(dtype=np.float64)
+    n = len(y)
+    valid = ~np.isnan(y)
+    if times is None:
+        width = int(period)
+        x = np.cumsum(valid, dtype=np.int64)
+        pos = np.arange(n, dtype=np.int64)
+        start = np.maximum(pos - width + 1, 0)
+        block = pos // width
+        x_scale = 1.0
+    else:
+        times = np.asarray(times, dtype=np.int64)
+        if n > 1 and (np.diff(times) < 0).any():
+            raise ValueError("index must be monotonic")
+        width = int(period) * NS_PER_MINUTE
+        x = times
+        start = np.searchsorted(times, times - width, side="right")
+        block = (times - times[0]) // width if n else times
+        x_scale = 1.0 / NS_PER_MINUTE
+    slope = np.full(n, np.nan)
+    if n == 0 or not valid.any():
+        return slope
+
+    # область блока b: блоки b-1 и b; точки областей идут подряд в одном массиве
+    blocks, last = np.unique(block, return_index=True)
+    last = np.append(last[1:], n) - 1
+    first = np.searchsorted(block, blocks - 1, side="left")
+    lengths = last - first + 1
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    region = np.repeat(np.arange(len(blocks)), lengths)
+    idx = np.arange(lengths.sum()) - np.repeat(offsets - first, lengths)
+
+    # опорные точки: x в начале области, y — первое непустое значение в ней
+    x_ref = x[first]
+    y_filled = pd.Series(np.where(valid, y, np.nan)).bfill().to_numpy()
+    y_ref = np.nan_to_num(y_filled[first])
+    ok = valid[idx]
+    dx = np.where(ok, (x[idx] - x_ref[region]) * x_scale, 0.0)
+    dy = np.where(ok, y[idx] - y_ref[region], 0.0)
+    sums = pd.DataFrame({
+        "n": ok.astype(np.float64),
+        "x": dx,
+        "y": dy,
+        "xx": dx * dx,
+        "xy": dx * dy,
+    }).groupby(region).cumsum().to_numpy()
+
+    # окно [start, i] точки i: разность нарастающих итогов в области её блока
+    own = np.searchsorted(blocks, block)
+    end_at = offsets[own] + np.arange(n) - first[own]
+    window = sums[end_at].copy()
+    inner = start > first[own]
+    window[inner] -= sums[end_at[inner] - (np.arange(n)[inner] - start[inner]) - 1]
+    count, sx, sy, sxx, sxy = window.T
+    with np.errstate(all="ignore"):
+        var = count * sxx - sx * sx
+        slope = (count * sxy - sx * sy) / var
+    slope[~((count >= 2) & (var > 0))] = np.nan
+    return slope
 
 
 def _get_xy_from_table(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
@@ -34,11 +164,84 @@ def _get_xy_from_table(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
         raise CodeEvaluationError("GETPOINT: недостаточно точек для интерполяции (нужно >= 2).")
     return x, y
 
-def _interp_1d(x: np.ndarray, y: np.ndarray, xq: np.ndarray) -> np.ndarray:
-    order = np.argsort(x)
-    xs = x[order]
-    ys = y[order]
-    return np.interp(xq, xs, ys)  # линейная интерполяция, clamp по краям
+
+# ---------- кривые GETPOINT ----------
+
+class InterpCurve:
+    """
+    Кусочно-линейная функция по точкам (как np.interp): x по возрастанию, вне диапазона —
+    значение на краю. Повторы x сохраняются в порядке таблицы (устойчивая сортировка):
+    слева от повтора функция идёт к первой его точке, в самой точке и справа — от последней.
+    У больших кривых с равномерным шагом отрезок находится арифметикой, а не поиском.
+    """
+
+    UNIFORM_MIN_POINTS = 4096
+
+    def __init__(self, x: np.ndarray, y: np.ndarray):
+        order = np.argsort(x, kind="stable")
+        self.x = np.ascontiguousarray(x[order], dtype=np.float64)
+        self.y = np.ascontiguousarray(y[order], dtype=np.float64)
+        # списки — для поточечного поиска (bisect) без накладных расходов numpy
+        self._x_list = self.x.tolist()
+        self._y_list = self.y.tolist()
+
+        self.step = None
+        if len(self.x) >= self.UNIFORM_MIN_POINTS:
+            step = (self.x[-1] - self.x[0]) / (len(self.x) - 1)
+            if step > 0 and np.allclose(np.diff(self.x), step, rtol=1e-9, atol=0.0):
+                self.step = step
+
+    def __call__(self, xq: np.ndarray) -> np.ndarray:
+        if self.step is None or len(self.x) < 2:
+            return np.interp(xq, self.x, self.y)
+        xq = np.asarray(xq, dtype=np.float64)
+        pos = np.nan_to_num((xq - self.x[0]) / self.step)
+        j = np.clip(np.floor(pos), 0, len(self.x) - 2).astype(np.intp)
+        t = np.clip(pos - j, 0.0, 1.0)
+        result = self.y[j] + t * (self.y[j + 1] - self.y[j])
+        result[np.isnan(xq)] = np.nan
+        return result
+
+    def at(self, xq: float) -> float:
+        """Значение в одной точке: бинарный поиск отрезка (правый — как у np.interp)"""
+        if xq != xq:
+            return np.nan
+        xs, ys = self._x_list, self._y_list
+        if xq < xs[0]:
+            return ys[0]
+        if xq >= xs[-1]:
+            return ys[-1]
+        j = bisect_right(xs, xq) - 1
+        slope = (ys[j + 1] - ys[j]) / (xs[j + 1] - xs[j])
+        return slope * (xq - xs[j]) + ys[j]
+
+
+@dataclass(frozen=True)
+class TableCurves:
+    x_to_y: InterpCurve
+    y_to_x: InterpCurve
+    monotonic: bool  # Y строго монотонна по X — обратный поиск однозначен
+
+
+def prepare_table(df: pd.DataFrame) -> TableCurves:
+    """Кривые X -> Y и Y -> X таблицы GETPOINT"""
+    x, y = _get_xy_from_table(df)
+    x_to_y = InterpCurve(x, y)
+    dy = np.diff(x_to_y.y)
+    monotonic = bool(np.all(dy > 0) or np.all(dy < 0))
+    return TableCurves(x_to_y, InterpCurve(y, x), monotonic)
+
+
+def table_curves(name: str, tables: TableSet | None = None) -> Tuple["TableCurves | None", str | None]:
+    """(кривые, ошибка) таблицы из набора tables (по умолчанию — текущего)"""
+    if tables is None:
+        tables = _TABLES
+    curves = tables.curves.get(name)
+    if curves is not None:
+        return curves, None
+    if name in tables.errors:
+        return None, tables.errors[name]
+    return None, f"таблица '{name}' не загружена"
 
 
 class CodeEvaluationError(Exception):
@@ -52,70 +255,119 @@ def sanitize_numeric_column(series: pd.Series) -> pd.Series:
     return pd.to_numeric(text, errors="coerce")
 
 
+# Флаг в DataFrame.attrs: все колонки уже float64, повторная очистка не нужна.
+# Выборка колонок (df[[...]]) и добавление колонок флаг сохраняют, поэтому
+# в такой кадр дописываются только float64-сигналы.
+NUMERIC_FRAME_FLAG = "numeric_float64"
+
+
+def coerce_signal_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит все колонки к float64 (один раз при загрузке) и помечает кадр флагом"""
+    if not all(dtype == np.float64 for dtype in df.dtypes):
+        df = pd.DataFrame(
+            {col: sanitize_numeric_column(df[col]).astype(np.float64) for col in df.columns},
+            index=df.index,
+        )
+    df.attrs[NUMERIC_FRAME_FLAG] = True
+    return df
+
+
+def is_numeric_frame(df: pd.DataFrame) -> bool:
+    return bool(df.attrs.get(NUMERIC_FRAME_FLAG))
+
+
+def numeric_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Колонка как число: из помеченного кадра — без очистки"""
+    series = df[name]
+    return series if is_numeric_frame(df) else sanitize_numeric_column(series)
+
+
+# ---------- разбор и план вычисления ----------
+
+_TRUTH_CONSTANTS = {"TRUE": 1.0, "FALSE": 0.0}
+
+
+def _special_signal_names(columns) -> Tuple[str, ...]:
+    """Имена сигналов, которые лексер не распознает общим правилом идентификатора"""
+    return _special_names_of(tuple(map(str, columns)))
+
+
+@lru_cache(maxsize=256)
+def _special_names_of(columns: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(sorted(c for c in columns if needs_special_name(c)))
+
+
+def _tree_inputs(tree) -> List[str]:
+    """Идентификаторы и строковые литералы формулы — кандидаты в имена сигналов"""
+    literals = [node.value for node in iter_nodes(tree) if isinstance(node, Str)]
+    return list(dict.fromkeys(referenced_names(tree) + literals))
+
+
+def code_input_names(code_str: str, signal_names) -> List[str]:
+    """
+    Сигналы из signal_names, на которые ссылается формула: идентификаторы и строки
+    с именем сигнала (HISTORYAVG("10MAA50CP001", 60)). Пустой список при ошибке разбора.
+    """
+    names = set(map(str, signal_names))
+    try:
+        tree = parse_code(code_str, _special_signal_names(names))
+    except CodeSyntaxError:
+        return []
+    return [name for name in _tree_inputs(tree) if name in names]
+
+
+def _bind_name(name: str, series_map: Dict[str, pd.Series], tables: TableSet) -> Tuple[str, str, object]:
+    """Связывает идентификатор формулы: сигнал > X/Y > таблица > TRUE/FALSE > np.<const>"""
+    if name in series_map:
+        return name, BIND_SIGNAL, name
+    if name in ("X", "Y") or name in tables.frames:
+        return name, BIND_STRING, name
+    if name.upper() in _TRUTH_CONSTANTS:
+        return name, BIND_CONST, _TRUTH_CONSTANTS[name.upper()]
+    if name.startswith("np."):
+        value = getattr(np, name[3:], None)
+        if isinstance(value, (int, float)):
+            return name, BIND_CONST, float(value)
+    raise CodeEvaluationError(f"name '{name}' is not defined")
+
+
+@lru_cache(maxsize=1024)
+def _get_plan(code_str: str, special: Tuple[str, ...], bindings: Tuple[Tuple[str, str, object], ...]) -> CodePlan:
+    """План кэшируется по тексту формулы и связыванию её имён"""
+    plan = compile_plan(parse_code(code_str, special), bindings)
+    if plan.temporaries:
+        print(
+            f"[INFO] CODE plan: {plan.nodes_before} -> {plan.nodes_after} nodes, "
+            f"{plan.temporaries} common subexpressions"
+        )
+    return plan
+
+
 def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Series, List[str]]:
-    if df_all is None or df_all.empty:
+    if df_all is None or len(df_all.index) == 0:
         raise CodeEvaluationError("Нет данных для расчёта синтетического сигнала.")
     if not code_str or not code_str.strip():
         raise CodeEvaluationError("Строка CODE пуста.")
 
     index = df_all.index
-    numeric_df = df_all.apply(sanitize_numeric_column)
-    series_map = {col: numeric_df[col] for col in numeric_df.columns}
+    n = len(index)
     warnings: List[str] = []
+    tables = registered_tables()
 
-    # ---------- обработка «неправильных» имён сигналов ----------
-    safe_name_map: Dict[str, str] = {}
-    used_safe_names = set()
-
-    def _make_safe_name(original: str, idx: int) -> str:
-        base = re.sub(r"\W", "_", original)
-        if not base or not re.match(r"[A-Za-z_]", base):
-            base = f"SIG_{idx}"
-        while base in used_safe_names:
-            base += "_"
-        used_safe_names.add(base)
-        return base
-
-    sorted_signals = sorted(series_map.keys(), key=len, reverse=True)
-    for idx, sig_name in enumerate(sorted_signals):
-        safe = _make_safe_name(sig_name, idx)
-        safe_name_map[sig_name] = safe
-
-    def _replace_signal_names(expr: str) -> str:
-        result = []
-        i = 0
-        in_string = False
-        string_char = ""
-
-        while i < len(expr):
-            ch = expr[i]
-            if in_string:
-                result.append(ch)
-                if ch == string_char and expr[i - 1] != "\\":
-                    in_string = False
-                i += 1
-                continue
-
-            if ch in ("'", '"'):
-                in_string = True
-                string_char = ch
-                result.append(ch)
-                i += 1
-                continue
-
-            matched = None
-            for name in sorted_signals:
-                if expr.startswith(name, i):
-                    matched = name
-                    break
-            if matched:
-                result.append(safe_name_map[matched])
-                i += len(matched)
-            else:
-                result.append(ch)
-                i += 1
-
-        return "".join(result)
+    # ---------- разбор: AST кэшируется по тексту формулы ----------
+    special = _special_signal_names(df_all.columns)
+    try:
+        tree = parse_code(code_str, special)
+    except CodeSyntaxError as exc:
+        raise CodeEvaluationError(str(exc)) from exc
+
+    # ---------- колонки: только те, на которые ссылается формула ----------
+    columns = df_all.columns
+    series_map = {
+        name: numeric_column(df_all, name)
+        for name in _tree_inputs(tree)
+        if name in columns
+    }
 
     # ---------- вспомогательные функции ----------
     def _ensure_series(value) -> pd.Series:
@@ -126,10 +378,12 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
                 return value.iloc[:, 0].reindex(index)
             raise CodeEvaluationError("Невозможно привести DataFrame с несколькими колонками к Series.")
         if isinstance(value, (list, tuple, np.ndarray)):
-            arr = np.asarray(value, dtype=float)
+            arr = np.asarray(value)
+            if arr.dtype.kind not in ("b", "f"):
+                arr = arr.astype(float)
             if arr.size == 1:
-                arr = np.full(len(index), arr.item())
-            elif arr.shape[0] != len(index):
+                arr = np.full(n, arr.item())
+            elif arr.shape[0] != n:
                 return pd.Series(np.nan, index=index)
             return pd.Series(arr, index=index)
         if value is None or np.isscalar(value):
@@ -139,65 +393,71 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
         except Exception as exc:
             raise CodeEvaluationError(f"Невозможно преобразовать значение '{value}' к Series.") from exc
 
+    def _as_array(value) -> np.ndarray:
+        """Значение формулы -> массив длины n"""
+        if isinstance(value, np.ndarray) and value.ndim == 1 and value.shape[0] == n:
+            return value
+        return _ensure_series(value).to_numpy()
+
+    def _operand(value):
+        """Скаляры остаются скалярами (numpy их транслирует), остальное — массив длины n"""
+        if isinstance(value, (int, float, np.number, np.bool_)):
+            return value
+        return _as_array(value)
+
+    def _truth(value):
+        return np.asarray(_operand(value)).astype(bool)
+
+    def _nan_array() -> np.ndarray:
+        return np.full(n, np.nan)
+
     def _aggregate_nanfunc(func, args, empty_value=np.nan):
         if not args:
-            return pd.Series(empty_value, index=index)
-        stacked = np.vstack([_ensure_series(arg).values for arg in args])
-        return pd.Series(func(stacked, axis=0), index=index)
+            return np.full(n, empty_value)
+        stacked = np.vstack([_as_array(arg).astype(np.float64) for arg in args])
+        return func(stacked, axis=0)
 
     def GETPOINT(curveName, pointX, pointY, axisToFind):
         curve_name = str(curveName)
         axis = str(axisToFind).strip().upper()
 
-        df_tbl = TABLE_REGISTRY.get(curve_name)
-        if df_tbl is None:
+        curves, error = table_curves(curve_name, tables)
+        if curves is None:
             if "GETPOINT" not in warnings:
-                warnings.append(f"GETPOINT: таблица '{curve_name}' не загружена — NaN.")
-            return pd.Series(np.nan, index=index)
-
-        try:
-            x, y = _get_xy_from_table(df_tbl)
-        except Exception as e:
-            if "GETPOINT" not in warnings:
-                warnings.append(f"GETPOINT: ошибка таблицы '{curve_name}': {e}")
-            return pd.Series(np.nan, index=index)
+                warnings.append(f"GETPOINT: {error} — NaN.")
+            return _nan_array()
 
         if axis == "Y":
-            xq = _ensure_series(pointX).values.astype(np.float64)
-            out = _interp_1d(x, y, xq)
-            return pd.Series(out, index=index)
+            xq = _as_array(pointX).astype(np.float64)
+            return curves.x_to_y(xq)
 
         if axis == "X":
-            yq = _ensure_series(pointY).values.astype(np.float64)
-            out = _interp_1d(y, x, yq)
-            return pd.Series(out, index=index)
+            message = f"GETPOINT: таблица '{curve_name}' немонотонна — поиск X по Y неоднозначен."
+            if not curves.monotonic and message not in warnings:
+                warnings.append(message)
+            yq = _as_array(pointY).astype(np.float64)
+            return curves.y_to_x(yq)
 
         if "GETPOINT" not in warnings:
             warnings.append("GETPOINT: axisToFind должен быть 'X' или 'Y' — NaN.")
-        return pd.Series(np.nan, index=index)
+        return _nan_array()
 
     def PREV(param):
         s = _history_series(param)
         if s is None:
-            return pd.Series(np.nan, index=index)
-        return s.shift(1)
+            return _nan_array()
+        return s.shift(1).to_numpy()
 
     def _history_series(param):
-        # 1) Если уже Series — используем её
+        # 1) Series или массив, вычисленный формулой
         if isinstance(param, pd.Series):
             return sanitize_numeric_column(param).reindex(index)
+        if isinstance(param, (np.ndarray, int, float, np.number)) and not isinstance(param, bool):
+            return pd.Series(_as_array(param).astype(np.float64), index=index)
 
-        # 2) Если пришло "безопасное имя" (SIG_...) — оно уже есть в env как Series.
-        # Но сюда оно попадёт только если пользователь передал строку "SIG_0".
-        if isinstance(param, str):
-            # сначала пробуем как исходное имя сигнала
-            if param in series_map:
-                return series_map[param]
-
-            # потом пробуем как safe-name
-            for orig, safe in safe_name_map.items():
-                if param == safe:
-                    return series_map.get(orig)
+        # 2) Строка — имя сигнала: HISTORYAVG("10MAA50CP001", 60)
+        if isinstance(param, str) and param in series_map:
+            return series_map[param]
 
         return None
 
@@ -214,20 +474,20 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
         s = _history_series(param)
         window = _history_window(period)
         if s is None or window is None:
-            return pd.Series(np.nan, index=index)
+            return _nan_array()
 
         # 1) Если datetime-индекс — используем time-based rolling
         if isinstance(s.index, (pd.DatetimeIndex, pd.TimedeltaIndex, pd.PeriodIndex)):
-            return fn(s.rolling(window, min_periods=1))
+            return fn(s.rolling(window, min_periods=1)).to_numpy()
 
         # 2) Иначе пробуем интерпретировать period как "кол-во точек"
         try:
-            n = int(period)
-            if n <= 0:
-                return pd.Series(np.nan, index=index)
-            return fn(s.rolling(window=n, min_periods=1))
+            n_points = int(period)
+            if n_points <= 0:
+                return _nan_array()
+            return fn(s.rolling(window=n_points, min_periods=1)).to_numpy()
         except Exception:
-            return pd.Series(np.nan, index=index)
+            return _nan_array()
 
     HISTORYAVG = lambda n, p: _history_apply(n, p, lambda r: r.mean())
     HISTORYCOUNT = lambda n, p: _history_apply(n, p, lambda r: r.count())
@@ -236,8 +496,6 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
     HISTORYMIN = lambda n, p: _history_apply(n, p, lambda r: r.min())
     HISTORYDIFF = lambda n, p: _history_apply(n, p, lambda r: r.max() - r.min())
 
-# code_signal.py
-
     def HISTORYGRADIENT(param_name, period):
         """
         Возвращает коэффициент наклона (a) линейной регрессии y = a*x + b
@@ -251,86 +509,62 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
         """
         s = _history_series(param_name)
         if s is None:
-            return pd.Series(np.nan, index=index)
+            return _nan_array()
 
         # проверяем period
         try:
             minutes = int(period)
         except Exception:
-            return pd.Series(np.nan, index=index)
+            return _nan_array()
 
         if minutes <= 0:
-            return pd.Series(np.nan, index=index)
-
-        # функция, вычисляющая наклон по подсерии (сработает для любого окна)
-        def slope(window_series: pd.Series):
-            valid = window_series.dropna()
-            if len(valid) < 2:
-                return np.nan
-
-            # x: времена в минутах (если datetime), иначе последовательные индексы
-            if isinstance(valid.index, (pd.DatetimeIndex, pd.TimedeltaIndex, pd.PeriodIndex)):
-                # индекс в nanoseconds -> в минуты: /1e9 (сек) / 60
-                x = valid.index.view(np.int64).astype(float) / 1e9 / 60.0
-            else:
-                # используем относительные индексы 0..n-1 (шаги)
-                x = np.arange(len(valid), dtype=float)
-
-            y = valid.values.astype(float)
-
-            x_mean = x.mean()
-            y_mean = y.mean()
-            denom = np.sum((x - x_mean) ** 2)
-            if denom == 0:
-                return np.nan
-
-            num = np.sum((x - x_mean) * (y - y_mean))
-            return num / denom
-
-        # Выбираем rolling: если datetime-индекс — time-based, иначе window по числу точек
-        if isinstance(s.index, (pd.DatetimeIndex, pd.TimedeltaIndex, pd.PeriodIndex)):
-            window = f"{minutes}min"
-            rolling = s.rolling(window=window, min_periods=2)
-        else:
-            rolling = s.rolling(window=minutes, min_periods=2)
-
-        # Возвращаем Series с применённой функцией
-        return rolling.apply(slope, raw=False)
+            return _nan_array()
 
+        # x: времена в минутах (если datetime), иначе номера непустых точек
+        time_index = s.index
+        if isinstance(time_index, pd.PeriodIndex):
+            time_index = time_index.to_timestamp()
+        if isinstance(time_index, (pd.DatetimeIndex, pd.TimedeltaIndex)):
+            return rolling_slope(s, minutes, time_index.as_unit("ns").asi8)
+        return rolling_slope(s, minutes)
 
     def ROUND(a, b=0):
-        a_values = _ensure_series(a).values
-        b_values = _ensure_series(b).values
-        decimals = [
-            0 if np.isnan(dec) else int(round(dec))
-            for dec in b_values
-        ]
-        rounded = np.array([
-            np.round(val, dec) if not np.isnan(val) else np.nan
-            for val, dec in zip(a_values, decimals)
-        ])
-        return pd.Series(rounded, index=index)
-
-    # ---------- окружение eval ----------
-    env = {
-        "np": np,
-        "ABS": lambda a: pd.Series(np.abs(_ensure_series(a).values), index=index),
-        "EXP": lambda a: pd.Series(np.exp(_ensure_series(a).values), index=index),
-        "POW": lambda a, b: pd.Series(np.power(_ensure_series(a).values, _ensure_series(b).values), index=index),
+        """Число знаков b — скаляр или массив (NaN -> 0); массив округляется группами по b"""
+        a_values = _as_array(a).astype(np.float64)
+        b_values = np.asarray(_operand(b), dtype=np.float64)
+        b_values = np.where(np.isfinite(b_values), np.round(b_values), 0).astype(np.int64)
+
+        # 1) одно число знаков на весь сигнал
+        if b_values.ndim == 0:
+            return np.round(a_values, int(b_values))
+
+        # 2) по строкам: один np.round на каждое встречающееся число знаков
+        decimals, groups = np.unique(b_values, return_inverse=True)
+        if len(decimals) == 1:
+            return np.round(a_values, int(decimals[0]))
+        rounded = np.empty_like(a_values)
+        for k, dec in enumerate(decimals):
+            mask = groups == k
+            rounded[mask] = np.round(a_values[mask], int(dec))
+        return rounded
+
+    def WHEN(cond, t_val, f_val):
+        return np.where(_truth(cond), _operand(t_val), _operand(f_val))
+
+    # ---------- функции CODE (работают над массивами numpy) ----------
+    functions = {
+        "ABS": lambda a: np.abs(_operand(a)),
+        "EXP": lambda a: np.exp(_operand(a)),
+        "POW": lambda a, b: np.power(np.asarray(_operand(a), dtype=np.float64), _operand(b)),
         "MIN": lambda *args: _aggregate_nanfunc(np.nanmin, args),
         "MAX": lambda *args: _aggregate_nanfunc(np.nanmax, args),
         "AVG": lambda *args: _aggregate_nanfunc(np.nanmean, args, empty_value=0.0),
         "MED": lambda *args: _aggregate_nanfunc(np.nanmedian, args),
         "ROUND": ROUND,
-        "WHEN": lambda cond, t_val, f_val: pd.Series(
-            np.where(_ensure_series(cond).astype(bool).values,
-                     _ensure_series(t_val).values,
-                     _ensure_series(f_val).values),
-            index=index,
-        ),
-        "LOG": lambda x: pd.Series(np.log(_ensure_series(x).values), index=index),
+        "WHEN": WHEN,
+        "LOG": lambda x: np.log(_operand(x)),
         # Логарифм по основанию 10 (если нужен)
-        "LOG10": lambda x: pd.Series(np.log10(_ensure_series(x).values), index=index),
+        "LOG10": lambda x: np.log10(_operand(x)),
         "PREV": PREV,
         "HISTORYAVG": HISTORYAVG,
         "HISTORYCOUNT": HISTORYCOUNT,
@@ -340,36 +574,38 @@ def evaluate_code_expression(code_str: str, df_all: pd.DataFrame) -> Tuple[pd.Se
         "HISTORYDIFF": HISTORYDIFF,
         "HISTORYGRADIENT": HISTORYGRADIENT,
         "GETPOINT": GETPOINT,
+        # свойства пара IAPWS-IF97: h(p, t), s(p, t), t(p, s), ts(p), ps(t)
+        **STEAM_FUNCTIONS,
+        # логические операторы AND / OR / NOT
+        "__and__": lambda a, b: np.logical_and(_truth(a), _truth(b)),
+        "__or__": lambda a, b: np.logical_or(_truth(a), _truth(b)),
+        "__not__": lambda a: np.logical_not(_truth(a)),
     }
-    env["X"] = "X"
-    env["Y"] = "Y"
-
-    for original_name, safe_name in safe_name_map.items():
-        env[safe_name] = series_map[original_name]
 
-    for tbl_name in TABLE_REGISTRY.keys():
-        # если вдруг совпало с safe-именем сигнала — не перетираем сигнал
-        if tbl_name not in env:
-            env[tbl_name] = tbl_name
+    def _resolve_function(name: str):
+        if name in functions:
+            return functions[name]
+        if name.startswith("np.") and callable(getattr(np, name[3:], None)):
+            return getattr(np, name[3:])
+        raise CodeEvaluationError(f"name '{name}' is not defined")
 
-    def _normalize_expression(expr: str) -> str:
-        expr = re.sub(r"\bAND\b", "&", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bOR\b", "|", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bNOT\b", "~", expr, flags=re.IGNORECASE)
-        expr = expr.replace("<>", "!=")
-        expr = re.sub(r"(?<![<>=!])=(?![<>=])", "==", expr)
-        return expr
+    # ---------- план: компилируется один раз на формулу и набор имён ----------
+    bindings = tuple(_bind_name(name, series_map, tables) for name in referenced_names(tree))
+    plan = _get_plan(code_str, special, bindings)
 
-    normalized_code = _normalize_expression(code_str)
-    normalized_code = _replace_signal_names(normalized_code)
+    signal_arrays = tuple(series_map[name].to_numpy(dtype=np.float64) for name in plan.signals)
+    function_refs = tuple(_resolve_function(name) for name in plan.functions)
 
     try:
-        raw_result = eval(normalized_code, {"__builtins__": {}}, env)
+        with np.errstate(all="ignore"):
+            raw_result = plan.fn(signal_arrays, function_refs)
+    except CodeEvaluationError:
+        raise
     except Exception as exc:
         raise CodeEvaluationError(str(exc)) from exc
 
     result_series = _ensure_series(raw_result)
-    result_series.name = result_series.name or "CODE_RESULT"
+    result_series.name = "CODE_RESULT"
     return result_series, warnings
 
 def compute_code_signal(
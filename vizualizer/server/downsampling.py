@@ -0,0 +1,219 @@
+# downsampling.py — обрезка по времени и прореживание рядов перед отдачей клиенту
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+RESAMPLE_METHODS = ("mean", "minmax", "lttb")
+
+
+def trim_time_range(df: pd.DataFrame, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> pd.DataFrame:
+    """Оставляет строки с start <= datetime <= end (df отсортирован по datetime)"""
+    if start is None and end is None:
+        return df
+    dt = df["datetime"].to_numpy()
+    lo = 0 if start is None else int(np.searchsorted(dt, np.datetime64(start), side="left"))
+    hi = len(dt) if end is None else int(np.searchsorted(dt, np.datetime64(end), side="right"))
+    return df.iloc[lo:hi]
+
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+
+def _downsample_mean(t: np.ndarray, y: np.ndarray, max_points: int):
+    edges = _bucket_edges(len(y), max_points)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    sums = np.add.reduceat(y, starts)
+    return t[starts], sums / counts
+
+
+def _downsample_minmax(t: np.ndarray, y: np.ndarray, max_points: int):
+    buckets = max(1, max_points // 2)
+    edges = _bucket_edges(len(y), buckets)
+    starts = edges[:-1]
+    bucket_id = np.repeat(np.arange(buckets), np.diff(edges))
+
+    # argmin/argmax внутри каждого бакета через сортировку по (бакет, значение)
+    order = np.lexsort((y, bucket_id))
+    first = starts
+    last = edges[1:] - 1
+    i_min = order[first]
+    i_max = order[last]
+
+    picked = np.unique(np.concatenate([i_min, i_max]))
+    return t[picked], y[picked]
+
+
+def _downsample_lttb(t: np.ndarray, y: np.ndarray, max_points: int):
+    n = len(y)
+    if max_points < 3:
+        return _downsample_mean(t, y, max_points)
+
+    x = t.astype(np.int64).astype(np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    picked = np.empty(max_points, dtype=np.int64)
+    picked[0] = 0
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nhi <= nlo:
+            nhi = nlo + 1
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+
+        # площадь треугольника (a, кандидат, среднее следующего бакета)
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    picked[-1] = n - 1
+    return t[picked], y[picked]
+
+
+def downsample_frame(df: pd.DataFrame, max_points: int, method: str = "lttb") -> pd.DataFrame:
+    """
+    Прореживает DataFrame[datetime, value] до ~max_points точек.
+    method: mean — среднее по бакету, minmax — мин. и макс. каждого бакета,
+    lttb — Largest-Triangle-Three-Buckets. NaN-значения отбрасываются.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown resample method: {method}")
+    if max_points <= 0 or len(df) <= max_points:
+        return df
+
+    values = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+    mask = ~np.isnan(values)
+    t = df["datetime"].to_numpy()[mask]
+    y = values[mask]
+    if len(y) <= max_points:
+        return pd.DataFrame({"datetime": t, "value": y})
+
+    if method == "mean":
+        t_out, y_out = _downsample_mean(t, y, max_points)
+    elif method == "minmax":
+        t_out, y_out = _downsample_minmax(t, y, max_points)
+    else:
+        t_out, y_out = _downsample_lttb(t, y, max_points)
+    return pd.DataFrame({"datetime": t_out, "value": y_out})
+
+
+# =============================================================================
+# ОБЩАЯ СЕТКА ДЛЯ ШИРОКОЙ ТАБЛИЦЫ
+# =============================================================================
+#
+# downsample_frame выбирает точки каждого сигнала независимо, и после
+# объединения по времени широкая таблица почти вся из NaN (до N * max_points строк).
+# Для раскладки wide сигналы прореживаются на общей сетке: ось [t_min, t_max]
+# делится на бакеты равной длительности, каждый сигнал даёт в бакете значение
+# в общих точках сетки (середина бакета; для minmax — две точки на бакет).
+
+def _shared_buckets(t: np.ndarray, t0: int, width: float, buckets: int) -> np.ndarray:
+    ids = ((t - t0) / width).astype(np.int64)
+    return np.minimum(ids, buckets - 1)
+
+
+def _grid_mean(t, y, ids, buckets):
+    counts = np.bincount(ids, minlength=buckets)
+    sums = np.bincount(ids, weights=y, minlength=buckets)
+    present = counts > 0
+    return np.flatnonzero(present), sums[present] / counts[present]
+
+
+def _grid_minmax(t, y, ids, buckets):
+    """Две точки на бакет: сначала экстремум, который наступил раньше"""
+    order = np.lexsort((y, ids))
+    sorted_ids = ids[order]
+    present = np.unique(sorted_ids)
+    first = np.searchsorted(sorted_ids, present, side="left")
+    last = np.searchsorted(sorted_ids, present, side="right") - 1
+    i_min, i_max = order[first], order[last]
+    min_first = t[i_min] <= t[i_max]
+    early = np.where(min_first, y[i_min], y[i_max])
+    late = np.where(min_first, y[i_max], y[i_min])
+    slots = np.concatenate([2 * present, 2 * present + 1])
+    values = np.concatenate([early, late])
+    order = np.argsort(slots, kind="stable")
+    return slots[order], values[order]
+
+
+def _grid_lttb(t, y, ids, buckets):
+    """LTTB по бакетам времени: в каждом непустом бакете — точка с наибольшей площадью треугольника"""
+    x = t.astype(np.float64)
+    present = np.unique(ids)
+    starts = np.searchsorted(ids, present, side="left")
+    ends = np.searchsorted(ids, present, side="right")
+    picked = np.empty(len(present), dtype=np.int64)
+    a = 0
+    for k in range(len(present)):
+        lo, hi = starts[k], ends[k]
+        if k + 1 < len(present):
+            avg_x = x[starts[k + 1]:ends[k + 1]].mean()
+            avg_y = y[starts[k + 1]:ends[k + 1]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        picked[k] = a
+    return present, y[picked]
+
+
+def downsample_shared_grid(
+    signals_data: Dict[str, pd.DataFrame],
+    max_points: int,
+    method: str = "lttb",
+) -> Dict[str, pd.DataFrame]:
+    """
+    Прореживает сигналы DataFrame[datetime, value] на общей сетке времени:
+    не больше max_points различных отметок времени на все сигналы.
+    NaN-значения отбрасываются, пустые бакеты сигнала пропускаются.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown resample method: {method}")
+    if max_points <= 0 or all(len(df) <= max_points for df in signals_data.values()):
+        return signals_data
+
+    series = {}
+    for name, df in signals_data.items():
+        values = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+        t = df["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        mask = ~np.isnan(values)
+        order = np.argsort(t[mask], kind="stable")
+        series[name] = (t[mask][order], values[mask][order])
+
+    non_empty = [t for t, _ in series.values() if len(t)]
+    if not non_empty:
+        return signals_data
+    t0 = min(int(t[0]) for t in non_empty)
+    t1 = max(int(t[-1]) for t in non_empty)
+
+    buckets = max(1, max_points // 2) if method == "minmax" else max_points
+    width = max((t1 - t0) / buckets, 1.0)
+    slots_per_bucket = 2 if method == "minmax" else 1
+    slot_width = width / slots_per_bucket
+
+    out = {}
+    for name, (t, y) in series.items():
+        if not len(t):
+            out[name] = pd.DataFrame({"datetime": np.array([], dtype="datetime64[ns]"), "value": y})
+            continue
+        ids = _shared_buckets(t, t0, width, buckets)
+        if method == "mean":
+            slots, values = _grid_mean(t, y, ids, buckets)
+        elif method == "minmax":
+            slots, values = _grid_minmax(t, y, ids, buckets)
+        else:
+            slots, values = _grid_lttb(t, y, ids, buckets)
+        grid = (t0 + (slots + 0.5) * slot_width).astype(np.int64)
+        out[name] = pd.DataFrame({"datetime": grid.view("datetime64[ns]"), "value": values})
+    return out
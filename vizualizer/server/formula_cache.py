@@ -0,0 +1,263 @@
+# formula_cache.py — кэш вычисленных синтетических сигналов
+
+import contextlib
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from code_parser import CodeSyntaxError, tokenize
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Увеличивается при изменении семантики вычислителя — старые записи на диске перестают совпадать
+CACHE_VERSION = 4
+
+
+# =============================================================================
+# КЛЮЧ
+# =============================================================================
+#
+# Ключ синтетического сигнала — sha1 от:
+#   нормализованной формулы (последовательность токенов лексера),
+#   ключей всех входов: отпечаток архива для базового сигнала
+#   (имена и mtime файлов) или ключ для синтетического,
+#   окна времени загрузки и прочих параметров: оси времени расчёта,
+#   диапазонов функций пара из шаблонов, таблиц GETPOINT.
+# Поэтому изменение формулы, данных архива или зависимостей на любой глубине
+# меняет ключ всех сигналов выше по графу.
+
+def normalize_formula(formula: str) -> str:
+    """Формула в виде токенов лексера: без комментариев, пробелы не влияют"""
+    try:
+        tokens = tokenize(formula)
+    except CodeSyntaxError:
+        return formula.strip()
+    return " ".join(f"{kind}:{value!r}" for kind, value, _ in tokens)
+
+
+def make_formula_key(
+    formula: str,
+    inputs: Dict[str, str],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    extra: Iterable[str] = (),
+) -> str:
+    """inputs — {имя входа: отпечаток или ключ}"""
+    h = hashlib.sha1(f"v{CACHE_VERSION}\0".encode("utf-8"))
+    h.update(normalize_formula(formula).encode("utf-8"))
+    for name in sorted(inputs):
+        h.update(f"\0{name}={inputs[name]}".encode("utf-8"))
+    h.update(f"\0range={start}..{end}".encode("utf-8"))
+    for item in extra:
+        h.update(f"\0{item}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def index_fingerprint(index: pd.Index) -> str:
+    """Отпечаток оси времени, на которой считается формула"""
+    if isinstance(index, pd.DatetimeIndex):
+        values = index.as_unit("ns").asi8
+    else:
+        values = pd.util.hash_pandas_object(index, index=False).to_numpy()
+    return hashlib.sha1(np.ascontiguousarray(values).tobytes()).hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Отпечаток содержимого небольшой таблицы (GETPOINT)"""
+    values = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    columns = "|".join(map(str, df.columns)).encode("utf-8")
+    return hashlib.sha1(columns + values.tobytes()).hexdigest()
+
+
+# =============================================================================
+# КЭШ
+# =============================================================================
+
+class FormulaCache:
+    """
+    LRU-кэш Series синтетических сигналов с ограничением по объёму в памяти.
+    Вытесненные записи при заданном spill_folder сохраняются на диск
+    (<key>.npz: datetime int64 + value float64) и поднимаются обратно при обращении.
+    Потокобезопасен.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        spill_folder: Optional[str] = None,
+        max_spill_bytes: Optional[int] = None,
+    ):
+        self.max_bytes = int(max_bytes)
+        self.spill_folder = spill_folder
+        self.max_spill_bytes = int(max_spill_bytes) if max_spill_bytes is not None else 4 * self.max_bytes
+        self._items: "OrderedDict[str, pd.Series]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if spill_folder:
+            os.makedirs(spill_folder, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Доступ
+    # ------------------------------------------------------------------
+
+    def get(self, key: str, index: Optional[pd.Index] = None) -> Optional[pd.Series]:
+        """Series по ключу; при заданном index запись с другим индексом считается промахом"""
+        with self._lock:
+            series = self._items.get(key)
+            if series is not None and (index is None or series.index.equals(index)):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return series.copy()
+            if series is not None:
+                self.misses += 1
+                return None
+
+        series = self._load_spilled(key)
+        with self._lock:
+            if series is None or (index is not None and not series.index.equals(index)):
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.put(key, series, spill=False)
+        return series.copy()
+
+    def put(self, key: str, series: pd.Series, spill: bool = True):
+        size = _series_bytes(series)
+        if size > self.max_bytes:
+            if spill:
+                self._spill(key, series)
+            return
+
+        series = series.copy()
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= _series_bytes(old)
+            self._items[key] = series
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                old_key, old_series = self._items.popitem(last=False)
+                self._bytes -= _series_bytes(old_series)
+                self.evictions += 1
+                evicted.append((old_key, old_series))
+
+        # запись на диск — вне блокировки
+        for old_key, old_series in evicted:
+            self._spill(old_key, old_series)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._items:
+                return True
+        path = self._spill_path(key)
+        return path is not None and os.path.isfile(path)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------------------------------------
+    # Диск
+    # ------------------------------------------------------------------
+
+    def _spill_path(self, key: str) -> Optional[str]:
+        if not self.spill_folder:
+            return None
+        return os.path.join(self.spill_folder, f"{key}.npz")
+
+    def _spill(self, key: str, series: pd.Series):
+        path = self._spill_path(key)
+        if path is None or os.path.isfile(path):
+            return
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}.npz"
+        try:
+            np.savez(tmp_path, **_series_to_arrays(series))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[WARN] Formula cache: spill failed for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._prune_spill()
+
+    def _prune_spill(self):
+        """Удаляет самые давно использованные файлы, пока папка больше max_spill_bytes"""
+        try:
+            entries = [e for e in os.scandir(self.spill_folder) if e.name.endswith(".npz") and ".tmp-" not in e.name]
+            stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _load_spilled(self, key: str) -> Optional[pd.Series]:
+        path = self._spill_path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                series = _series_from_arrays(data)
+            os.utime(path)
+            return series
+        except Exception as e:
+            print(f"[WARN] Formula cache: broken spill file {os.path.basename(path)}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+
+
+def _series_bytes(series: pd.Series) -> int:
+    return int(series.memory_usage(index=True, deep=False))
+
+
+def _series_to_arrays(series: pd.Series) -> Dict[str, np.ndarray]:
+    arrays = {"value": series.to_numpy(dtype=np.float64)}
+    if isinstance(series.index, pd.DatetimeIndex):
+        arrays["datetime"] = series.index.as_unit("ns").asi8
+    else:
+        arrays["index"] = series.index.to_numpy()
+    arrays["name"] = np.array("" if series.name is None else str(series.name))
+    arrays["index_name"] = np.array("" if series.index.name is None else str(series.index.name))
+    return arrays
+
+
+def _series_from_arrays(data) -> pd.Series:
+    if "datetime" in data:
+        index = pd.DatetimeIndex(data["datetime"].astype("datetime64[ns]"))
+    else:
+        index = pd.Index(data["index"])
+    index.name = str(data["index_name"]) or None
+    name = str(data["name"]) or None
+    return pd.Series(data["value"], index=index, name=name)
@@ -0,0 +1,294 @@
+# iapws97.py — векторизованные свойства водяного пара IAPWS-IF97 для формул CODE
+#
+# Шаблоны h, s, t, ts, ps из formula_templates.json — это те же уравнения,
+# развёрнутые в текст из сотен POW(...). Здесь они вычисляются над массивами
+# numpy по схеме Горнера с заранее подготовленными коэффициентами.
+# Единицы как в шаблонах: p — МПа, t — °C, h — Дж/кг, s — Дж/(кг·К).
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+R_SPECIFIC = 461.526      # Дж/(кг·К)
+T_ZERO = 273.15
+
+
+# =============================================================================
+# ПОЛИНОМ Σ n·x^I·y^J ПО СХЕМЕ ГОРНЕРА
+# =============================================================================
+
+class SparsePoly:
+    """
+    Разреженный полином Σ n_i · x^I_i · y^J_i.
+    Члены группируются по степени x; внутри группы полином по y считается
+    разреженной схемой Горнера (множитель y^ΔJ между соседними степенями),
+    затем так же группы собираются по x.
+    """
+
+    def __init__(self, I, J, n):
+        I = np.asarray(I, dtype=np.float64)
+        J = np.asarray(J, dtype=np.float64)
+        n = np.asarray(n, dtype=np.float64)
+        keep = n != 0.0
+        I, J, n = I[keep], J[keep], n[keep]
+
+        self.x_exps = np.unique(I)
+        self.groups: List[Tuple[np.ndarray, np.ndarray]] = []
+        for e in self.x_exps:
+            sel = I == e
+            order = np.argsort(J[sel], kind="stable")
+            self.groups.append((J[sel][order], n[sel][order]))
+        self.I, self.J, self.n = I, J, n
+
+    def derivative(self, axis: str) -> "SparsePoly":
+        """Производная по x или y (коэффициенты пересчитываются один раз)"""
+        if axis == "x":
+            return SparsePoly(self.I - 1, self.J, self.n * self.I)
+        return SparsePoly(self.I, self.J - 1, self.n * self.J)
+
+    @staticmethod
+    def _horner(exps: np.ndarray, coefs, base, powers: Dict[float, np.ndarray]):
+        def pw(e):
+            if e not in powers:
+                powers[e] = base ** e
+            return powers[e]
+
+        acc = coefs[-1]
+        for k in range(len(exps) - 2, -1, -1):
+            acc = acc * pw(exps[k + 1] - exps[k]) + coefs[k]
+        return acc if exps[0] == 0 else acc * pw(exps[0])
+
+    def __call__(self, x, y):
+        y_powers: Dict[float, np.ndarray] = {}
+        x_powers: Dict[float, np.ndarray] = {}
+        inner = [self._horner(j, c, y, y_powers) for j, c in self.groups]
+        return self._horner(self.x_exps, inner, x, x_powers)
+
+
+# =============================================================================
+# КОЭФФИЦИЕНТЫ
+# =============================================================================
+
+# Область 2, идеально-газовая часть γ0 = ln π + Σ n0·τ^J0
+_R2_IDEAL_J = [0, 1, -5, -4, -3, -2, -1, 2, 3]
+_R2_IDEAL_N = [
+    -9.6927686500217, 10.086655968018, -0.005608791128302, 0.071452738081455,
+    -0.40710498223928, 1.4240819171444, -4.383951131945, -0.28408632460772,
+    0.021268463753307,
+]
+
+# Область 2, остаточная часть γr = Σ n·π^I·(τ - 0.5)^J
+_R2_I = [1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 4, 4, 4, 5, 6, 6, 6, 7, 7, 7, 8, 8, 9, 10, 10, 10, 16, 16, 18, 20, 20, 20, 21, 22, 23, 24, 24, 24]
+_R2_J = [0, 1, 2, 3, 6, 1, 2, 4, 7, 36, 0, 1, 3, 6, 35, 1, 2, 3, 7, 3, 16, 35, 0, 11, 25, 8, 36, 13, 4, 10, 14, 29, 50, 57, 20, 35, 48, 21, 53, 39, 26, 40, 58]
+_R2_N = [
+    -0.0017731742473213, -0.017834862292358, -0.045996013696365, -0.057581259083432,
+    -0.05032527872793, -3.3032641670203e-05, -0.00018948987516315, -0.0039392777243355,
+    -0.043797295650573, -2.6674547914087e-05, 2.0481737692309e-08, 4.3870667284435e-07,
+    -3.227767723857e-05, -0.0015033924542148, -0.040668253562649, -7.8847309559367e-10,
+    1.2790717852285e-08, 4.8225372718507e-07, 2.2922076337661e-06, -1.6714766451061e-11,
+    -0.0021171472321355, -23.895741934104, -5.905956432427e-18, -1.2621808899101e-06,
+    -0.038946842435739, 1.1256211360459e-11, -8.2311340897998, 1.9809712802088e-08,
+    1.0406965210174e-19, -1.0234747095929e-13, -1.0018179379511e-09, -8.0882908646985e-11,
+    0.10693031879409, -0.33662250574171, 8.9185845355421e-25, 3.0629316876232e-13,
+    -4.2002467698208e-06, -5.9056029685639e-26, 3.7826947613457e-06, -1.2768608934681e-15,
+    7.3087610595061e-29, 5.5414715350778e-17, -9.436970724121e-07,
+]
+
+# Обратное уравнение T(p, s), подобласть 2a: θ = Σ n·π^I·(σ - 2)^J, σ = s / 2000
+_T2A_I = [-1.5, -1.5, -1.5, -1.5, -1.5, -1.5, -1.25, -1.25, -1.25, -1, -1, -1, -1, -1, -1, -0.75, -0.75, -0.5, -0.5, -0.5, -0.5, -0.25, -0.25, -0.25, -0.25, 0.25, 0.25, 0.25, 0.25, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.75, 0.75, 0.75, 0.75, 1, 1, 1.25, 1.25, 1.5, 1.5]
+_T2A_J = [-24, -23, -19, -13, -11, -10, -19, -15, -6, -26, -21, -17, -16, -9, -8, -15, -14, -26, -13, -9, -7, -27, -25, -11, -6, 1, 4, 8, 11, 0, 1, 5, 6, 10, 14, 16, 0, 4, 9, 17, 7, 18, 3, 15, 5, 18]
+_T2A_N = [
+    -392359.83861984, 515265.7382727, 40482.443161048, -321.93790923902,
+    96.961424218694, -22.867846371773, -449429.14124357, -5011.8336020166,
+    0.35684463560015, 44235.33584819, -13673.388811708, 421632.60207864,
+    22516.925837475, 474.42144865646, -149.31130797647, -197811.26320452,
+    -23554.39947076, -19070.616302076, 55375.669883164, 3829.3691437363,
+    -603.91860580567, 1936.3102620331, 4266.064369861, -5978.0638872718,
+    -704.01463926862, 338.36784107553, 20.862786635187, 0.033834172656196,
+    -4.3124428414893e-05, 166.53791356412, -139.86292055898, -0.78849547999872,
+    0.072132411753872, -0.0059754839398283, -1.2141358953904e-05, 2.3227096733871e-07,
+    -10.538463566194, 2.0718925496502, -0.072193155260427, 2.074988708112e-07,
+    -0.018340657911379, 2.9036272348696e-07, 0.21037527893619, 0.00025681239729999,
+    -0.012799002933781, -8.2198102652018e-06,
+]
+
+# Подобласть 2b: θ = Σ n·π^I·(10 - σ)^J, σ = s / 785.3
+_T2B_I = [-6, -6, -5, -5, -4, -4, -4, -3, -3, -3, -3, -2, -2, -2, -2, -1, -1, -1, -1, -1, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5]
+_T2B_J = [0, 11, 0, 11, 0, 1, 11, 0, 1, 11, 12, 0, 1, 6, 10, 0, 1, 5, 8, 9, 0, 1, 2, 4, 5, 6, 9, 0, 1, 2, 3, 7, 8, 0, 1, 5, 0, 1, 3, 0, 1, 0, 1, 2]
+_T2B_N = [
+    316876.65083497, 20.864175881858, -398593.99803599, -21.816058518877,
+    223697.85194242, -2784.1703445817, 9.920743607148, -75197.512299157,
+    2970.8605951158, -3.4406878548526, 0.38815564249115, 17511.29508575,
+    -1423.7112854449, 1.0943803364167, 0.89971619308495, -3375.9740098958,
+    471.62885818355, -1.9188241993679, 0.41078580492196, -0.33465378172097,
+    1387.0034777505, -406.63326195838, 41.72734715961, 2.1932549434532,
+    -1.0320050009077, 0.35882943516703, 0.0052511453726066, 12.838916450705,
+    -2.8642437219381, 0.56912683664855, -0.099962954584931, -0.0032632037778459,
+    0.00023320922576723, -0.1533480985745, 0.029072288239902, 0.00037534702741167,
+    0.0017296691702411, -0.00038556050844504, -3.5017712292608e-05, -1.4566393631492e-05,
+    5.6420857267269e-06, 4.1286150074605e-08, -2.0684671118824e-08, 1.6409393674725e-09,
+]
+
+# Подобласть 2c: θ = Σ n·π^I·(2 - σ)^J, σ = s / 2925.1
+_T2C_I = [-2, -2, -1, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6, 6, 7, 7, 7, 7, 7]
+_T2C_J = [0, 1, 0, 0, 1, 2, 3, 0, 1, 3, 4, 0, 1, 2, 0, 1, 5, 0, 1, 4, 0, 1, 2, 0, 1, 0, 1, 3, 4, 5]
+_T2C_N = [
+    909.68501005365, 2404.566708842, -591.6232638713, 541.45404128074,
+    -270.98308411192, 979.76525097926, -469.66772959435, 14.399274604723,
+    -19.104204230429, 5.3299167111971, -21.252975375934, -0.3114733441376,
+    0.60334840894623, -0.042764839702509, 0.0058185597255259, -0.014597008284753,
+    0.0056631175631027, -7.6155864584577e-05, 0.00022440342919332, -1.2561095013413e-05,
+    6.3323132660934e-07, -2.0541989675375e-06, 3.6405370390082e-08, -2.9759897789215e-09,
+    1.0136618529763e-08, 5.9925719692351e-12, -2.0677870105164e-11, -2.0874278181886e-11,
+    1.0162166825089e-10, -1.6429828281347e-10,
+]
+
+# Линия насыщения, n1..n10
+_SAT_N = [
+    1167.0521452767, -724213.16703206, -17.073846940092, 12020.82470247,
+    -3232555.0322333, 14.91510861353, -4823.2657361591, 405113.40542057,
+    -0.23855557567849, 650.17534844798,
+]
+
+_GAMMA0 = SparsePoly(np.zeros(len(_R2_IDEAL_J)), _R2_IDEAL_J, _R2_IDEAL_N)
+_GAMMA0_TAU = _GAMMA0.derivative("y")
+_GAMMAR = SparsePoly(_R2_I, _R2_J, _R2_N)
+_GAMMAR_TAU = _GAMMAR.derivative("y")
+_T2A = SparsePoly(_T2A_I, _T2A_J, _T2A_N)
+_T2B = SparsePoly(_T2B_I, _T2B_J, _T2B_N)
+_T2C = SparsePoly(_T2C_I, _T2C_J, _T2C_N)
+
+
+# =============================================================================
+# ФУНКЦИИ (без проверки диапазонов)
+# =============================================================================
+
+def enthalpy_pt(p, t):
+    """Энтальпия перегретого пара, Дж/кг (p — МПа, t — °C)"""
+    T = t + T_ZERO
+    tau = 540.0 / T
+    g_tau = _GAMMA0_TAU(0.0, tau) + _GAMMAR_TAU(p, tau - 0.5)
+    return R_SPECIFIC * T * tau * g_tau
+
+
+def entropy_pt(p, t):
+    """Энтропия перегретого пара, Дж/(кг·К) (p — МПа, t — °C)"""
+    tau = 540.0 / (t + T_ZERO)
+    g = np.log(p) + _GAMMA0(0.0, tau) + _GAMMAR(p, tau - 0.5)
+    g_tau = _GAMMA0_TAU(0.0, tau) + _GAMMAR_TAU(p, tau - 0.5)
+    return R_SPECIFIC * (tau * g_tau - g)
+
+
+def temperature_ps(p, s):
+    """Температура перегретого пара по давлению и энтропии, °C (обратные уравнения 2a/2b/2c)"""
+    p, s = np.broadcast_arrays(np.asarray(p, dtype=np.float64), np.asarray(s, dtype=np.float64))
+    out = np.full(p.shape, -1.0)
+
+    sub_a = (p > 0) & (p <= 4)
+    sub_b = (p > 4) & (s >= 5850)
+    sub_c = (p > 4) & ~(s >= 5850)
+    if sub_a.any():
+        out[sub_a] = _T2A(p[sub_a], s[sub_a] / 2000 - 2) - T_ZERO
+    if sub_b.any():
+        out[sub_b] = _T2B(p[sub_b], 10 - s[sub_b] / 785.3) - T_ZERO
+    if sub_c.any():
+        out[sub_c] = _T2C(p[sub_c], 2 - s[sub_c] / 2925.1) - T_ZERO
+    return out
+
+
+def saturation_temperature(p):
+    """Температура насыщения, °C (p — МПа)"""
+    n1, n2, n3, n4, n5, n6, n7, n8, n9, n10 = _SAT_N
+    beta = p ** 0.25
+    E = (beta + n3) * beta + n6
+    F = (n1 * beta + n4) * beta + n7
+    G = (n2 * beta + n5) * beta + n8
+    D = 2.0 * G / (-F - np.sqrt(F * F - 4.0 * E * G))
+    return (n10 + D - np.sqrt((n10 + D) ** 2 - 4.0 * (n9 + n10 * D))) / 2.0 - T_ZERO
+
+
+def saturation_pressure(t):
+    """Давление насыщения, МПа (t — °C)"""
+    n1, n2, n3, n4, n5, n6, n7, n8, n9, n10 = _SAT_N
+    T = t + T_ZERO
+    theta = T + n9 / (T - n10)
+    A = (theta + n1) * theta + n2
+    B = (n3 * theta + n4) * theta + n5
+    C = (n6 * theta + n7) * theta + n8
+    return (2.0 * C / (-B + np.sqrt(B * B - 4.0 * A * C))) ** 4
+
+
+# =============================================================================
+# ФУНКЦИИ CODE С ПРОВЕРКОЙ ДИАПАЗОНОВ
+# =============================================================================
+#
+# Как и развёрнутый шаблон (WHEN(args в [min, max], тело, return_value)),
+# функция возвращает return_value, если хотя бы один аргумент вне диапазона
+# или NaN. Диапазоны по умолчанию совпадают с args шаблонов и обновляются
+# из formula_templates.json через apply_template_ranges.
+
+@dataclass
+class SteamFunction:
+    name: str
+    fn: Callable
+    args: Tuple[str, ...]
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = field(default_factory=dict)
+    fallback: float = -1.0
+
+    def __call__(self, *values):
+        if len(values) != len(self.args):
+            raise TypeError(f"{self.name}() takes {len(self.args)} arguments ({len(values)} given)")
+        arrays = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in values))
+        mask = np.ones(arrays[0].shape, dtype=bool)
+        for arg, arr in zip(self.args, arrays):
+            lo, hi = self.ranges.get(arg, (None, None))
+            if lo is not None:
+                mask &= arr >= lo
+            if hi is not None:
+                mask &= arr <= hi
+
+        out = np.full(arrays[0].shape, self.fallback, dtype=np.float64)
+        if mask.any():
+            with np.errstate(all="ignore"):
+                out[mask] = self.fn(*(arr[mask] for arr in arrays))
+        return out if out.ndim else out.item()
+
+
+STEAM_FUNCTIONS: Dict[str, SteamFunction] = {
+    "h": SteamFunction("h", enthalpy_pt, ("p", "t"), {"p": (0.1, 100.0), "t": (100.0, 800.0)}),
+    "s": SteamFunction("s", entropy_pt, ("p", "t"), {"p": (0.1, 100.0), "t": (100.0, 800.0)}),
+    "t": SteamFunction("t", temperature_ps, ("p", "s"), {"p": (0.1, 100.0)}),
+    "ts": SteamFunction("ts", saturation_temperature, ("p",), {"p": (0.000611212, 22.064)}),
+    "ps": SteamFunction("ps", saturation_pressure, ("t",), {"t": (0.01, 373.946)}),
+}
+
+
+def apply_template_ranges(templates: List[Dict]):
+    """Берёт min/max аргументов и return_value из шаблонов с флагом native"""
+    for tpl in templates or []:
+        func = STEAM_FUNCTIONS.get(tpl.get("name"))
+        if func is None or not tpl.get("native"):
+            continue
+        args = tpl.get("args") or {}
+        if tuple(args) != func.args:
+            print(f"[WARN] Template '{func.name}' args {tuple(args)} != native {func.args}, ranges kept")
+            continue
+        func.ranges = {
+            name: (conf.get("min"), conf.get("max"))
+            for name, conf in args.items()
+            if conf.get("min") is not None or conf.get("max") is not None
+        }
+        if tpl.get("return_value") is not None:
+            func.fallback = float(tpl["return_value"])
+
+
+def steam_functions_version() -> str:
+    """Отпечаток диапазонов и return_value функций пара — меняется вместе с шаблонами"""
+    state = [
+        (func.name, sorted(func.ranges.items()), func.fallback)
+        for _, func in sorted(STEAM_FUNCTIONS.items())
+    ]
+    return hashlib.sha1(repr(state).encode("utf-8")).hexdigest()
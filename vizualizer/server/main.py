@@ -2,16 +2,32 @@
 
 import os
 import json
+import time
 import uuid
-import pickle
-import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Dict, List, Any, Optional
 from io import BytesIO
 from update_projects import update_projects_if_templates_changed
+from archive_store import (
+    ensure_archive_file,
+    load_archive_file,
+    merge_signal_frames,
+    prune_archive_store,
+    resolve_cache_folder,
+)
+from downsampling import RESAMPLE_METHODS, downsample_frame, downsample_shared_grid
+from signal_index import SignalIndex
+from code_signal import coerce_signal_frame, register_tables, register_templates
+from formula_cache import DEFAULT_MAX_BYTES, FormulaCache
+from signal_compute import compute_synthetic_signals, formula_cache_keys, read_table_excel
 
+import numpy as np
 import pandas as pd
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -24,7 +40,9 @@ from pydantic import BaseModel
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_PATH = os.path.join(BASE_DIR, "settings.json")
 TEMPLATES_PATH = os.path.join(BASE_DIR, "formula_templates.json")
-SIGNAL_INDEX_PATH = os.path.join(BASE_DIR, ".signal_index.pkl")
+SIGNAL_INDEX_PATH = os.path.join(BASE_DIR, ".signal_index.sqlite")
+# Загрузка архивов упирается в диск — число ядер здесь не ориентир
+DEFAULT_ARCHIVE_WORKERS = 4
 
 
 # =============================================================================
@@ -61,8 +79,20 @@ STATE = {
     "signal_index": None,
     "templates": None,
     "tables": None,
+    "archive_pool": None,
+    "archive_watcher": None,
+    "signal_index_refreshed_at": None,
+    "signal_index_checked_at": None,
+    "formula_cache": None,
+    "compute_pool": None,
+    "project_index": None,
+    "table_frames": {},
 }
 
+SIGNAL_INDEX_LOCK = threading.Lock()
+TABLE_FRAMES_LOCK = threading.Lock()
+PROJECT_INDEX_LOCK = threading.Lock()
+
 
 def load_tables_from_folder(folder: str) -> List[Dict]:
     folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
@@ -115,6 +145,46 @@ def refresh_tables_cache():
             item["Description"] = meta[name]
     STATE["tables"] = base_list
 
+
+def refresh_table_frames():
+    """
+    Загружает таблицы GETPOINT из tablesFolder в вычислитель.
+    Перечитываются только новые и изменённые xlsx.
+    """
+    folder = (STATE["settings"] or {}).get("tablesFolder")
+    if not folder:
+        return
+    folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
+    if not os.path.isdir(folder_abs):
+        return
+
+    with TABLE_FRAMES_LOCK:
+        frames = STATE["table_frames"]
+        current = {}
+        for name in os.listdir(folder_abs):
+            if name.lower().endswith(".xlsx"):
+                current[os.path.splitext(name)[0]] = os.path.getmtime(os.path.join(folder_abs, name))
+
+        changed = set(frames) - set(current)
+        for table_name, mtime in current.items():
+            if table_name in frames and frames[table_name][0] == mtime:
+                continue
+            try:
+                df = read_table_excel(os.path.join(folder_abs, f"{table_name}.xlsx"))
+            except Exception as e:
+                # до изменения файла повторно не читаем
+                print(f"[WARN] Table '{table_name}' not loaded: {e}")
+                df = None
+            frames[table_name] = (mtime, df)
+            changed.add(table_name)
+
+        if changed:
+            for table_name in set(frames) - set(current):
+                frames.pop(table_name)
+            tables = {table_name: df for table_name, (_, df) in frames.items() if df is not None}
+            register_tables(tables)
+            print(f"[OK] Tables for GETPOINT: {len(tables)}")
+
 # Хранилище сессий визуализатора (в памяти)
 visualize_sessions: Dict[str, Dict[str, Any]] = {}
 
@@ -244,130 +314,230 @@ def refresh_signals_cache():
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ — ИНДЕКС СИГНАЛОВ
 # =============================================================================
 
-def build_signal_index(folder: str) -> Dict[str, List[str]]:
-    """Строит индекс: signal_name -> list of files"""
+def files_for_signals(
+    signal_names: List[str],
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> Dict[str, List[str]]:
+    """
+    Файлы, которые нужно открыть: {filepath: [сигналы из запроса в нём]}.
+    При заданном start/end пропускаются файлы, чьё покрытие по времени не пересекается с окном.
+    """
+    signal_index: SignalIndex | None = STATE.get("signal_index")
+    if signal_index is None:
+        return {}
+    start_ns = None if start is None else pd.Timestamp(start).as_unit("ns").value
+    end_ns = None if end is None else pd.Timestamp(end).as_unit("ns").value
+    return signal_index.files_for(signal_names, start_ns, end_ns)
+
+
+def signal_fingerprints(
+    signal_names: List[str],
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> Dict[str, str]:
+    """{signal: отпечаток файлов архива, из которых он читается в окне start..end}"""
+    signal_index: SignalIndex | None = STATE.get("signal_index")
+    if signal_index is None:
+        return {}
+    start_ns = None if start is None else pd.Timestamp(start).as_unit("ns").value
+    end_ns = None if end is None else pd.Timestamp(end).as_unit("ns").value
+    return signal_index.fingerprints(signal_names, start_ns, end_ns)
+
+
+def load_signal_index(folder: str) -> SignalIndex:
+    """Открывает индекс архива и досканирует только добавленные/изменённые файлы"""
     folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
-    
     if not os.path.isdir(folder_abs):
         raise FileNotFoundError(f"Signal data folder not found: {folder_abs}")
-    
-    signal_index = {}
-    print(f"[INFO] Building signal index from {folder_abs}...")
-    
-    for filename in os.listdir(folder_abs):
-        if not filename.lower().endswith(".csv"):
-            continue
-        
-        filepath = os.path.join(folder_abs, filename)
-        try:
-            df_header = pd.read_csv(filepath, nrows=0, encoding="ISO-8859-2", sep=";")
-            columns = df_header.columns.tolist()
-            signal_columns = [c for c in columns if c not in ["DATE", "TIME", "datetime"]]
-            
-            for signal_name in signal_columns:
-                if signal_name not in signal_index:
-                    signal_index[signal_name] = []
-                signal_index[signal_name].append(filepath)
-            
-            print(f"  ✓ {filename}: {len(signal_columns)} signals")
-        except Exception as e:
-            print(f"  ✗ Failed to index {filename}: {e}")
-            continue
-    
-    print(f"[OK] Total unique signals indexed: {len(signal_index)}")
-    return signal_index
 
+    index = SignalIndex(SIGNAL_INDEX_PATH, folder_abs)
+    updated, removed = index.sync()
+    if updated or removed:
+        print(f"[OK] Signal index updated: {index.file_count()} files, {len(index)} signals")
+    else:
+        print(f"[OK] Signal index loaded ({len(index)} signals)")
+    STATE["signal_index_refreshed_at"] = time.time()
+    return index
 
-def load_signal_index(folder: str) -> Dict[str, List[str]]:
-    """Загружает индекс из кэша или перестраивает"""
-    folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
+
+def refresh_signal_index() -> bool:
+    """
+    Проверяет папку архива и при изменениях обновляет индекс
+    и колоночное хранилище. Возвращает True, если индекс изменился.
+    """
+    signal_index: SignalIndex | None = STATE.get("signal_index")
+    if signal_index is None:
+        return False
     
-    def get_folder_state(path: str) -> dict:
-        if not os.path.isdir(path):
-            return {}
-        state = {}
-        for name in os.listdir(path):
-            if name.lower().endswith(".csv"):
-                filepath = os.path.join(path, name)
-                state[name] = os.path.getmtime(filepath)
-        return state
+    with SIGNAL_INDEX_LOCK:
+        updated, removed = signal_index.sync()
+        STATE["signal_index_checked_at"] = time.time()
+        if not updated and not removed:
+            return False
+        STATE["signal_index_refreshed_at"] = time.time()
     
-    current_state = get_folder_state(folder_abs)
+    print(f"[OK] Signal index updated: {signal_index.file_count()} files, {len(signal_index)} signals")
     
-    # Пробуем загрузить кэш
-    if os.path.exists(SIGNAL_INDEX_PATH):
+    cache_folder = get_archive_cache_folder()
+    if cache_folder:
+        prune_archive_store(cache_folder, signal_index.file_names())
+        for filename in updated:
+            try:
+                ensure_archive_file(os.path.join(signal_index.folder_abs, filename), cache_folder)
+            except Exception as e:
+                print(f"[WARN] Failed to ingest {filename}: {e}")
+    
+    return True
+
+
+def _archive_watcher(stop: threading.Event, interval: float):
+    """Фоновый опрос папки архива и папки проектов (изменённые и удалённые JSON)"""
+    print(f"[OK] Archive watcher started (every {interval:g}s)")
+    while not stop.wait(interval):
         try:
-            with open(SIGNAL_INDEX_PATH, "rb") as f:
-                cached_data = pickle.load(f)
-            
-            if isinstance(cached_data, dict) and "_folder_state" in cached_data:
-                cached_state = cached_data["_folder_state"]
-                cached_index = cached_data["index"]
-                
-                if cached_state == current_state:
-                    print(f"[OK] Signal index loaded from cache ({len(cached_index)} signals)")
-                    return cached_index
-                else:
-                    print(f"[INFO] CSV files changed, rebuilding index...")
-            else:
-                print(f"[INFO] Old cache format, rebuilding index...")
+            refresh_signal_index()
         except Exception as e:
-            print(f"[WARN] Failed to load cached index: {e}")
-    
-    # Перестраиваем индекс
-    index = build_signal_index(folder)
-    
-    # Сохраняем с метаданными
-    try:
-        cache_data = {"index": index, "_folder_state": current_state}
-        with open(SIGNAL_INDEX_PATH, "wb") as f:
-            pickle.dump(cache_data, f)
-        print(f"[OK] Signal index cached with folder state")
-    except Exception as e:
-        print(f"[WARN] Failed to cache signal index: {e}")
-    
-    return index
+            print(f"[WARN] Archive watcher failed: {e}")
+        try:
+            refresh_project_index()
+        except Exception as e:
+            print(f"[WARN] Project index refresh failed: {e}")
 
 
-def load_signal_data_optimized(signal_names: List[str], folder: str) -> Dict[str, pd.DataFrame]:
-    """Загружает только нужные сигналы из только нужных файлов"""
-    folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
-    
-    signal_index = STATE.get("signal_index", {})
-    if not signal_index:
+def start_archive_watcher():
+    """Запускает опрос папки архива (settings.json: archivePollInterval, секунды; 0 — выключен)"""
+    interval = float((STATE["settings"] or {}).get("archivePollInterval", 0) or 0)
+    if interval <= 0:
+        return
+    stop = threading.Event()
+    thread = threading.Thread(target=_archive_watcher, args=(stop, interval), name="archive-watcher", daemon=True)
+    thread.start()
+    STATE["archive_watcher"] = stop
+
+
+def get_archive_cache_folder() -> str | None:
+    """Каталог колоночного хранилища архива (None — читать CSV напрямую)"""
+    folder = (STATE["settings"] or {}).get("archiveCacheFolder")
+    if not folder:
+        return None
+    return resolve_cache_folder(folder, BASE_DIR)
+
+
+def get_formula_cache() -> FormulaCache:
+    """
+    Общий кэш вычисленных синтетических сигналов.
+    settings.json: formulaCacheMaxMB, formulaCacheFolder (выгрузка на диск).
+    """
+    if STATE["formula_cache"] is not None:
+        return STATE["formula_cache"]
+
+    settings = STATE["settings"] or {}
+    max_mb = settings.get("formulaCacheMaxMB")
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+    folder = settings.get("formulaCacheFolder")
+    spill_folder = resolve_cache_folder(folder, BASE_DIR) if folder else None
+    STATE["formula_cache"] = FormulaCache(max_bytes=max_bytes, spill_folder=spill_folder)
+    print(f"[OK] Formula cache: {max_bytes // (1024 * 1024)} MB in memory, spill folder: {spill_folder}")
+    return STATE["formula_cache"]
+
+
+def get_compute_pool() -> Executor | None:
+    """
+    Пул потоков для расчёта независимых синтетических сигналов одного уровня графа.
+    settings.json: computeWorkers (0 — по числу ядер, 1 — последовательно).
+    Потоки, а не процессы: векторные операции numpy отпускают GIL, а df_all
+    не приходится копировать в каждый процесс.
+    """
+    if STATE["compute_pool"] is not None:
+        return STATE["compute_pool"]
+
+    workers = int((STATE["settings"] or {}).get("computeWorkers", 0) or 0)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        return None
+
+    STATE["compute_pool"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compute")
+    print(f"[OK] Synthetic compute pool: {workers} threads")
+    return STATE["compute_pool"]
+
+
+def get_archive_pool() -> Executor | None:
+    """
+    Пул для параллельной загрузки архивных файлов.
+    settings.json: archiveLoadWorkers (0 — DEFAULT_ARCHIVE_WORKERS, 1 — без пула),
+    archiveLoadExecutor ("thread" | "process").
+    Потоки по умолчанию: загрузка упирается в диск, а результат не нужно
+    сериализовать обратно. Процессы запускаются через spawn — fork из
+    многопоточного uvicorn унаследовал бы блокировки потоков и соединение sqlite.
+    """
+    if STATE["archive_pool"] is not None:
+        return STATE["archive_pool"]
+
+    settings = STATE["settings"] or {}
+    workers = int(settings.get("archiveLoadWorkers", 0) or 0)
+    if workers <= 0:
+        workers = DEFAULT_ARCHIVE_WORKERS
+    if workers == 1:
+        return None
+
+    kind = settings.get("archiveLoadExecutor", "thread")
+    if kind == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        kind = "thread"
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive")
+    STATE["archive_pool"] = pool
+    print(f"[OK] Archive load pool: {kind}, {workers} workers")
+    return pool
+
+
+def load_signal_data_optimized(
+    signal_names: List[str],
+    folder: str,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> Dict[str, pd.DataFrame]:
+    """Загружает только нужные сигналы из только нужных файлов (опционально — за start..end)"""
+    if STATE.get("signal_index") is None:
         raise RuntimeError("Signal index not initialized")
     
     signal_names_set = set(signal_names)
-    found_signals = {}
-    files_to_load = set()
-    
-    for signal_name in signal_names_set:
-        if signal_name in signal_index:
-            files_to_load.update(signal_index[signal_name])
+    files_to_load = files_for_signals(signal_names, start, end)
     
-    print(f"[INFO] Loading {len(signal_names_set)} signals from {len(files_to_load)} files")
-    
-    for filepath in files_to_load:
-        try:
-            df = pd.read_csv(filepath, encoding="ISO-8859-2", sep=";")
-            
-            df["TIME"] = df["TIME"].str.replace(",", ".", regex=False)
-            df["TIME"] = df["TIME"].str.split(".").str[0]
-            combined = df["DATE"] + " " + df["TIME"]
-            df["datetime"] = pd.to_datetime(combined, format="%d.%m.%Y %H:%M:%S", errors="coerce")
-            df = df.dropna(subset=["datetime"])
-            df = df.drop(['DATE', 'TIME'], axis=1)
-            df = df.sort_values("datetime")
-            
-            available_columns = set(df.columns) & signal_names_set
-            for signal_name in available_columns:
-                if signal_name not in found_signals:
-                    found_signals[signal_name] = df[["datetime", signal_name]].copy()
-                    found_signals[signal_name].columns = ["datetime", "value"]
-        except Exception as e:
-            print(f"[WARN] Failed to read {filepath}: {e}")
-            continue
+    cache_folder = get_archive_cache_folder()
+    pool = get_archive_pool() if len(files_to_load) > 1 else None
+    print(f"[INFO] Loading {len(signal_names_set)} signals from {len(files_to_load)} files"
+          f"{' (columnar store)' if cache_folder else ''}{' in parallel' if pool else ''}")
     
+    started = time.perf_counter()
+    parts: Dict[str, List[pd.DataFrame]] = {}
+
+    def collect(filepath: str, found: Dict[str, pd.DataFrame], elapsed: float):
+        print(f"  ✓ {os.path.basename(filepath)}: {len(found)} signals in {elapsed:.2f}s")
+        for signal_name, df_signal in found.items():
+            parts.setdefault(signal_name, []).append(df_signal)
+
+    if pool is None:
+        for filepath, file_signals in files_to_load.items():
+            try:
+                collect(*load_archive_file(filepath, file_signals, cache_folder, start, end))
+            except Exception as e:
+                print(f"[WARN] Failed to read {filepath}: {e}")
+    else:
+        futures = {
+            pool.submit(load_archive_file, filepath, file_signals, cache_folder, start, end): filepath
+            for filepath, file_signals in files_to_load.items()
+        }
+        for future in as_completed(futures):
+            try:
+                collect(*future.result())
+            except Exception as e:
+                print(f"[WARN] Failed to read {futures[future]}: {e}")
+
+    found_signals = {name: merge_signal_frames(frames) for name, frames in parts.items()}
+    print(f"[OK] Loaded {len(found_signals)} signals in {time.perf_counter() - started:.2f}s")
     return found_signals
 
 
@@ -408,41 +578,94 @@ def extract_input_signals_from_project(project_data: Dict) -> List[str]:
     return input_signals
 
 
-def load_project_by_code(code: str) -> Dict | None:
-    """Загружает проект по его коду (Tagname)"""
+def refresh_project_index() -> Dict[str, Dict]:
+    """
+    Индекс code -> проект по папке projectDataFolder.
+    Перечитываются только новые и изменённые JSON (по mtime), исчезнувшие удаляются.
+    """
     folder = STATE["settings"].get("projectDataFolder")
-    if not folder:
-        return None
-    
-    folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
-    if not os.path.isdir(folder_abs):
-        return None
-    
-    for name in os.listdir(folder_abs):
-        if not name.endswith(".json"):
-            continue
-        path = os.path.join(folder_abs, name)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                payload = json.load(f)
-            proj = payload.get("project", {})
-            if proj.get("code") == code:
-                return {
+    folder_abs = None
+    if folder:
+        folder_abs = folder if os.path.isabs(folder) else os.path.normpath(os.path.join(BASE_DIR, folder))
+
+    with PROJECT_INDEX_LOCK:
+        index = STATE["project_index"]
+        if index is None or index["folder"] != folder_abs:
+            index = {"folder": folder_abs, "files": {}, "by_code": {}}
+            STATE["project_index"] = index
+        if not folder_abs or not os.path.isdir(folder_abs):
+            index["files"].clear()
+            index["by_code"].clear()
+            return index["by_code"]
+
+        files = index["files"]
+        current = {}
+        for name in os.listdir(folder_abs):
+            if name.endswith(".json"):
+                current[name] = os.path.getmtime(os.path.join(folder_abs, name))
+
+        changed = False
+        for name in set(files) - set(current):
+            files.pop(name)
+            changed = True
+        for name, mtime in current.items():
+            if name in files and files[name][0] == mtime:
+                continue
+            path = os.path.join(folder_abs, name)
+            entry = None
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                proj = payload.get("project", {})
+                entry = {
                     "project": proj,
                     "formula": payload.get("code", ""),
                     "elements": payload.get("elements", {})
                 }
-        except Exception as e:
-            print(f"[WARN] Error reading project {path}: {e}")
-            continue
-    
-    return None
+            except Exception as e:
+                print(f"[WARN] Error reading project {path}: {e}")
+            files[name] = (mtime, entry)
+            changed = True
+
+        if changed:
+            by_code = {}
+            for name in sorted(files):
+                entry = files[name][1]
+                code = entry and entry["project"].get("code")
+                if code and code not in by_code:
+                    by_code[code] = entry
+            index["by_code"] = by_code
+        return index["by_code"]
+
+
+def invalidate_project_index(path: str | None = None):
+    """Сбрасывает запись файла (или весь индекс) — mtime мог не измениться при быстрой перезаписи"""
+    with PROJECT_INDEX_LOCK:
+        index = STATE["project_index"]
+        if index is None:
+            return
+        if path is None:
+            STATE["project_index"] = None
+        else:
+            index["files"].pop(os.path.basename(path), None)
+
+
+def load_project_by_code(code: str, refresh: bool = False) -> Dict | None:
+    """
+    Проект по его коду (Tagname) из индекса проектов.
+    Индекс актуализируют старт, сохранение проекта, фоновый опрос и разворачивание
+    зависимостей; refresh=True — дополнительно сверить папку проектов сейчас.
+    """
+    index = STATE["project_index"]
+    if refresh or index is None:
+        return refresh_project_index().get(code)
+    return index["by_code"].get(code)
 
 
 def is_base_signal(signal_name: str) -> bool:
     """Проверяет, есть ли сигнал в архиве (базовый сигнал с данными)"""
-    signal_index = STATE.get("signal_index", {})
-    return signal_name in signal_index
+    signal_index = STATE.get("signal_index")
+    return signal_index is not None and signal_name in signal_index
 
 
 def resolve_signal_dependencies(
@@ -453,6 +676,8 @@ def resolve_signal_dependencies(
     """Рекурсивно разворачивает зависимости сигналов"""
     if visited is None:
         visited = set()
+        # одна сверка папки проектов на всё разворачивание, дальше — поиск по словарю
+        refresh_project_index()
     if resolved is None:
         resolved = {}
     
@@ -583,11 +808,15 @@ def upsert_formula_template_from_project(content: Dict[str, Any]) -> None:
         json.dump(templates_data, f, ensure_ascii=False, indent=2)
 
     STATE["templates"] = templates_data
+    register_templates(updated)
     print(f"[OK] Template '{template_name}' saved/updated in formula_templates.json")
 
 
-def topological_sort_signals(synthetic_signals: Dict[str, Dict]) -> List[str]:
-    """Топологическая сортировка (игнорирует самоссылки для корректной сортировки)"""
+def topological_levels(synthetic_signals: Dict[str, Dict]) -> List[List[str]]:
+    """
+    Уровни графа зависимостей (игнорирует самоссылки): уровень 0 зависит только от базовых
+    сигналов, уровень k — от сигналов уровней < k. Сигналы одного уровня независимы.
+    """
     if not synthetic_signals:
         return []
     
@@ -602,22 +831,27 @@ def topological_sort_signals(synthetic_signals: Dict[str, Dict]) -> List[str]:
                 graph[dep].append(name)
                 in_degree[name] += 1
     
-    queue = [name for name, degree in in_degree.items() if degree == 0]
-    result = []
+    level = [name for name, degree in in_degree.items() if degree == 0]
+    levels = []
+    placed = 0
     
-    while queue:
-        node = queue.pop(0)
-        result.append(node)
-        for neighbor in graph[node]:
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
-                queue.append(neighbor)
+    while level:
+        levels.append(level)
+        placed += len(level)
+        next_level = []
+        for node in level:
+            for neighbor in graph[node]:
+                in_degree[neighbor] -= 1
+                if in_degree[neighbor] == 0:
+                    next_level.append(neighbor)
+        level = next_level
     
-    if len(result) != len(synthetic_signals):
-        cyclic = [name for name in synthetic_signals if name not in result]
+    if placed != len(synthetic_signals):
+        done = {name for lvl in levels for name in lvl}
+        cyclic = [name for name in synthetic_signals if name not in done]
         raise ValueError(f"Циклическая зависимость между сигналами: {cyclic}")
     
-    return result
+    return levels
 
 
 # =============================================================================
@@ -661,15 +895,48 @@ def startup():
     os.makedirs(template_dir, exist_ok=True)
     
     refresh_signals_cache()
+    refresh_project_index()
     STATE["templates"] = load_templates()
+    register_templates(STATE["templates"].get("templates", []))
     STATE["signal_index"] = load_signal_index(settings.get("signalArchiveFolder"))
 
+    cache_folder = get_archive_cache_folder()
+    if cache_folder:
+        prune_archive_store(cache_folder, STATE["signal_index"].file_names())
+
+    start_archive_watcher()
+
     print(f"[OK] Loaded signals: {len(STATE['signals'])}")
     print(f"[OK] Signal index has {len(STATE['signal_index'])} unique signals")
     print(f"[OK] Loaded templates: {len(STATE['templates'].get('templates', []))}")
+    print(f"[OK] Project index: {len(STATE['project_index']['by_code'])} projects")
     print(f"[OK] Loaded tables: {len(STATE['tables'] or [])}")
 
 
+@app.on_event("shutdown")
+def shutdown():
+    """Останавливает опрос архива и пул загрузки"""
+    stop = STATE.get("archive_watcher")
+    if stop is not None:
+        stop.set()
+        STATE["archive_watcher"] = None
+
+    signal_index = STATE.get("signal_index")
+    if signal_index is not None:
+        signal_index.close()
+        STATE["signal_index"] = None
+
+    pool = STATE.get("archive_pool")
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        STATE["archive_pool"] = None
+
+    pool = STATE.get("compute_pool")
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        STATE["compute_pool"] = None
+
+
 # =============================================================================
 # API — НАСТРОЙКИ И СИГНАЛЫ
 # =============================================================================
@@ -680,6 +947,24 @@ def api_settings():
     return STATE["settings"]
 
 
+@app.get("/api/signal-index/status")
+def api_signal_index_status():
+    """Состояние индекса архива: размер и время последнего обновления/проверки"""
+    def fmt(ts):
+        return None if ts is None else pd.Timestamp(ts, unit="s", tz="UTC").isoformat()
+
+    settings = STATE["settings"] or {}
+    signal_index = STATE.get("signal_index")
+    return {
+        "signals": len(signal_index) if signal_index is not None else 0,
+        "files": signal_index.file_count() if signal_index is not None else 0,
+        "last_refresh": fmt(STATE.get("signal_index_refreshed_at")),
+        "last_check": fmt(STATE.get("signal_index_checked_at")),
+        "poll_interval": float(settings.get("archivePollInterval", 0) or 0),
+        "watcher_running": STATE.get("archive_watcher") is not None,
+    }
+
+
 @app.get("/api/tables")
 def api_tables(q: str = "", limit: int = 50):
     settings = STATE["settings"] or {}
@@ -862,6 +1147,8 @@ async def save_project(request: Request):
 
         # Обновляем кэш сигналов (проекты-шаблоны могут тоже появляться в описаниях)
         refresh_signals_cache()
+        invalidate_project_index(path)
+        refresh_project_index()
 
         return {"status": "ok", "message": f"Project saved to {filename}"}
 
@@ -901,27 +1188,49 @@ async def api_signal_data(request: Request):
         data = await request.json()
         signal_names = data.get("signal_names", [])
         output_format = data.get("format", "parquet")
+        layout = _parse_layout(data)
+        start = _parse_time_param(data.get("start"), "start")
+        end = _parse_time_param(data.get("end"), "end")
+        max_points = data.get("max_points")
+        resample = data.get("resample", "lttb")
         
         if not signal_names:
             raise HTTPException(status_code=400, detail="signal_names is required")
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="max_points must be an integer")
+        if resample not in RESAMPLE_METHODS:
+            raise HTTPException(status_code=400, detail=f"resample must be one of {list(RESAMPLE_METHODS)}")
         
         folder = STATE["settings"].get("signalArchiveFolder")
         if not folder:
             raise HTTPException(status_code=500, detail="signalArchiveFolder not configured")
         
-        signals_data = load_signal_data_optimized(signal_names, folder)
+        # чтение архива и прореживание блокируют — в пуле потоков, как расчёт сигналов
+        signals_data = await run_in_threadpool(
+            load_signal_window, signal_names, folder, start, end, max_points, resample, layout
+        )
         
         response = {
             "found": list(signals_data.keys()),
             "not_found": [s for s in signal_names if s not in signals_data],
             "format": output_format
         }
+        if start is not None or end is not None:
+            response["range"] = [_format_time_param(start), _format_time_param(end)]
+        if max_points:
+            response["max_points"] = max_points
+            response["resample"] = resample
         
         if not signals_data:
             raise HTTPException(status_code=404, detail="No signals found")
         
-        if output_format == "parquet":
-            return await _export_parquet(signals_data, response)
+        if output_format == "arrow":
+            return await _export_arrow(signals_data, response, layout)
+        elif output_format == "parquet":
+            return await _export_parquet(signals_data, response, layout)
         else:
             return await _export_json(signals_data, response)
     
@@ -932,33 +1241,237 @@ async def api_signal_data(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def _export_parquet(signals_data: Dict[str, pd.DataFrame], meta: Dict):
-    """Экспортирует данные в Parquet"""
+def load_signal_window(
+    signal_names: List[str],
+    folder: str,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    max_points: int | None,
+    resample: str,
+    layout: str,
+) -> Dict[str, pd.DataFrame]:
+    """Загружает сигналы за окно времени и прореживает до max_points (блокирующий вызов)"""
+    signals_data = load_signal_data_optimized(signal_names, folder, start=start, end=end)
+    if max_points and layout == "wide":
+        # общая сетка времени — иначе широкая таблица почти вся из NaN
+        return downsample_shared_grid(signals_data, max_points, resample)
+    if max_points:
+        return {
+            name: downsample_frame(df, max_points, resample)
+            for name, df in signals_data.items()
+        }
+    return signals_data
+
+
+def _parse_time_param(value: Any, name: str) -> pd.Timestamp | None:
+    """
+    Разбирает start/end запроса (ISO-строка) в Timestamp.
+    Архив хранит время без зоны, и время без зоны передаётся как есть.
+    Время с зоной (…Z, …+03:00) переводится в зону архива из settings.json
+    (archiveTimezone); если она не задана — 400, угадывать зону архива нельзя.
+    """
+    if value in (None, ""):
+        return None
     try:
-        with tempfile.NamedTemporaryFile(suffix=".parquet", delete=False) as tmp:
-            tmp_path = tmp.name
-        
-        rows = []
-        for signal_name, df in signals_data.items():
-            df_copy = df.copy()
-            df_copy["signal_name"] = signal_name
-            rows.append(df_copy)
-        
-        combined = pd.concat(rows, ignore_index=True)
-        combined.to_parquet(tmp_path, compression='snappy', index=False)
-        
-        file_size = os.path.getsize(tmp_path)
-        print(f"[OK] Exported {len(signals_data)} signals to Parquet: {file_size / 1024 / 1024:.2f} MB")
-        
-        return FileResponse(
-            tmp_path,
-            media_type="application/octet-stream",
-            filename="signal_data.parquet",
-            headers={"X-Signal-Meta": json.dumps(meta)}
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    if ts.tzinfo is None:
+        return ts
+    archive_tz = (STATE["settings"] or {}).get("archiveTimezone")
+    if not archive_tz:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} has a timezone, but archiveTimezone is not configured; pass local archive time",
         )
-    except Exception as e:
-        print(f"[ERROR] Parquet export failed: {e}")
-        raise
+    try:
+        return ts.tz_convert(archive_tz).tz_localize(None)
+    except Exception:
+        raise HTTPException(status_code=500, detail=f"Invalid archiveTimezone: {archive_tz}")
+
+
+def _format_time_param(value: pd.Timestamp | None) -> str | None:
+    return None if value is None else value.isoformat()
+
+
+ARROW_BATCH_ROWS = 65536
+
+
+def build_wide_frame(signals_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Собирает сигналы в широкую таблицу: datetime + колонка float64 на сигнал"""
+    columns = []
+    for signal_name, df in signals_data.items():
+        series = pd.Series(
+            pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype="float64"),
+            index=pd.DatetimeIndex(df["datetime"]),
+            name=signal_name,
+        )
+        columns.append(series[~series.index.duplicated(keep="first")])
+    wide = pd.concat(columns, axis=1).sort_index()
+    data = {"datetime": wide.index.to_numpy(dtype="datetime64[ns]")}
+    data.update({name: wide[name].to_numpy() for name in wide.columns})
+    return pd.DataFrame(data)
+
+
+# Раскладка выгрузки arrow/parquet:
+#   long — строки (datetime, value, signal_name), как было исходно (по умолчанию);
+#   wide — datetime + колонка float64 на сигнал (по запросу layout="wide").
+# Обе пишутся батчами по ARROW_BATCH_ROWS строк: широкая таблица целиком
+# в памяти не собирается, батч строится по своему отрезку времени.
+EXPORT_LAYOUTS = ("long", "wide")
+
+
+def _parse_layout(data: Dict) -> str:
+    layout = data.get("layout", "long")
+    if layout not in EXPORT_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"layout must be one of {list(EXPORT_LAYOUTS)}")
+    return layout
+
+
+def _signal_arrays(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """(datetime int64 по возрастанию без дублей — первый, value float64) одного сигнала"""
+    ts = df["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    values = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+    if len(ts) > 1 and not np.all(np.diff(ts) > 0):
+        order = np.argsort(ts, kind="stable")
+        ts, values = ts[order], values[order]
+        keep = np.concatenate([[True], ts[1:] != ts[:-1]])
+        ts, values = ts[keep], values[keep]
+    return ts, values
+
+
+# meta выгрузки arrow/parquet целиком лежит в метаданных схемы (ключ SIGNAL_META_KEY:
+# схема потока Arrow IPC, key-value метаданные футера Parquet). Заголовок X-Signal-Meta
+# оставлен для старых клиентов и ограничен META_HEADER_LIMIT байтами: большие meta
+# (отчёт расчёта, сотни имён сигналов) не помещаются в лимит заголовков HTTP (~8 КБ).
+SIGNAL_META_KEY = b"signal_meta"
+META_HEADER_LIMIT = 4096
+
+
+def _export_schema(signals_data: Dict[str, pd.DataFrame], layout: str, meta: Dict):
+    import pyarrow as pa
+
+    if layout == "wide":
+        fields = [("datetime", pa.timestamp("ns"))] + [(name, pa.float64()) for name in signals_data]
+    else:
+        fields = [("datetime", pa.timestamp("ns")), ("value", pa.float64()), ("signal_name", pa.string())]
+    return pa.schema(fields, metadata={SIGNAL_META_KEY: json.dumps(meta, ensure_ascii=False)})
+
+
+def _meta_header(meta: Dict) -> str:
+    """X-Signal-Meta: meta целиком, если помещается в лимит, иначе только скалярные поля"""
+    text = json.dumps(meta)
+    if len(text) <= META_HEADER_LIMIT:
+        return text
+    short = {key: value for key, value in meta.items() if not isinstance(value, (list, dict))}
+    short["truncated"] = True
+    text = json.dumps(short)
+    return text if len(text) <= META_HEADER_LIMIT else json.dumps({"truncated": True})
+
+
+def _iter_wide_batches(signals_data: Dict[str, pd.DataFrame], schema):
+    """Широкие батчи по отрезкам общей оси времени"""
+    import pyarrow as pa
+
+    arrays = [_signal_arrays(df) for df in signals_data.values()]
+    grid = np.unique(np.concatenate([ts for ts, _ in arrays])) if arrays else np.array([], dtype=np.int64)
+    for offset in range(0, len(grid), ARROW_BATCH_ROWS):
+        chunk = grid[offset:offset + ARROW_BATCH_ROWS]
+        columns = [pa.array(chunk.view("datetime64[ns]"))]
+        for ts, values in arrays:
+            lo = int(np.searchsorted(ts, chunk[0], side="left"))
+            hi = int(np.searchsorted(ts, chunk[-1], side="right"))
+            column = np.full(len(chunk), np.nan)
+            column[np.searchsorted(chunk, ts[lo:hi])] = values[lo:hi]
+            columns.append(pa.array(column, from_pandas=True))
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _iter_long_batches(signals_data: Dict[str, pd.DataFrame], schema):
+    """Длинные батчи: сигналы друг за другом"""
+    import pyarrow as pa
+
+    for signal_name, df in signals_data.items():
+        ts = df["datetime"].to_numpy(dtype="datetime64[ns]")
+        values = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+        for offset in range(0, len(ts), ARROW_BATCH_ROWS):
+            part = slice(offset, offset + ARROW_BATCH_ROWS)
+            rows = len(ts[part])
+            yield pa.RecordBatch.from_arrays(
+                [
+                    pa.array(ts[part]),
+                    pa.array(values[part], from_pandas=True),
+                    pa.array([signal_name] * rows, type=pa.string()),
+                ],
+                schema=schema,
+            )
+
+
+def _iter_batches(signals_data: Dict[str, pd.DataFrame], schema, layout: str):
+    if layout == "wide":
+        return _iter_wide_batches(signals_data, schema)
+    return _iter_long_batches(signals_data, schema)
+
+
+def _drain(buffer: BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def _stream_response(chunks, meta: Dict, media_type: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "X-Signal-Meta": _meta_header(meta),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
+
+async def _export_arrow(signals_data: Dict[str, pd.DataFrame], meta: Dict, layout: str = "long"):
+    """Отдаёт данные потоком Arrow IPC (батчи по ARROW_BATCH_ROWS строк)"""
+    import pyarrow as pa
+
+    meta = {**meta, "layout": layout}
+    schema = _export_schema(signals_data, layout, meta)
+
+    def chunks():
+        buffer = BytesIO()
+        rows = 0
+        with pa.ipc.new_stream(buffer, schema) as writer:
+            yield _drain(buffer)
+            for batch in _iter_batches(signals_data, schema, layout):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                yield _drain(buffer)
+        yield _drain(buffer)
+        print(f"[OK] Streamed {len(signals_data)} signals as Arrow IPC ({layout}): {rows} rows")
+
+    return _stream_response(chunks(), meta, "application/vnd.apache.arrow.stream", "signal_data.arrow")
+
+
+async def _export_parquet(signals_data: Dict[str, pd.DataFrame], meta: Dict, layout: str = "long"):
+    """Отдаёт данные потоком Parquet (row group на батч)"""
+    import pyarrow.parquet as pq
+
+    meta = {**meta, "layout": layout}
+    schema = _export_schema(signals_data, layout, meta)
+
+    def chunks():
+        buffer = BytesIO()
+        rows = 0
+        with pq.ParquetWriter(buffer, schema, compression="snappy") as writer:
+            for batch in _iter_batches(signals_data, schema, layout):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                yield _drain(buffer)
+        yield _drain(buffer)
+        print(f"[OK] Streamed {len(signals_data)} signals as Parquet ({layout}): {rows} rows")
+
+    return _stream_response(chunks(), meta, "application/octet-stream", "signal_data.parquet")
 
 
 async def _export_json(signals_data: Dict[str, pd.DataFrame], meta: Dict):
@@ -968,6 +1481,8 @@ async def _export_json(signals_data: Dict[str, pd.DataFrame], meta: Dict):
         for signal_name, df in signals_data.items():
             df_copy = df.copy()
             df_copy["datetime"] = df_copy["datetime"].astype(str)
+            # значения теперь float64 — NaN отдаём как null
+            df_copy["value"] = df_copy["value"].astype(object).where(df_copy["value"].notna(), None)
             data_dict[signal_name] = df_copy.to_dict(orient="records")
         
         response_data = {**meta, "data": data_dict}
@@ -983,22 +1498,30 @@ async def api_resolve_signals(request: Request):
     try:
         data = await request.json()
         signal_names = data.get("signals", [])
+        start = _parse_time_param(data.get("start"), "start")
+        end = _parse_time_param(data.get("end"), "end")
         
         print(f"[INFO] Resolving dependencies for signals: {signal_names}")
         
         base_signals, synthetic_signals = resolve_signal_dependencies(signal_names)
-        computation_order = topological_sort_signals(synthetic_signals)
+        computation_levels = topological_levels(synthetic_signals)
+        computation_order = [name for level in computation_levels for name in level]
         
         print(f"[INFO] Base signals: {base_signals}")
         print(f"[INFO] Synthetic signals: {list(synthetic_signals.keys())}")
-        print(f"[INFO] Computation order: {computation_order}")
+        print(f"[INFO] Computation levels: {computation_levels}")
         
         return {
             "base_signals": list(base_signals),
             "synthetic_signals": synthetic_signals,
-            "computation_order": computation_order
+            "computation_order": computation_order,
+            "computation_levels": computation_levels,
+            # отпечатки файлов архива базовых сигналов — для ключей кэша формул
+            "fingerprints": signal_fingerprints(list(base_signals), start, end),
         }
     
+    except HTTPException:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -1006,6 +1529,121 @@ async def api_resolve_signals(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def compute_signals(
+    signal_names: List[str],
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+    include_dependencies: bool = False,
+) -> tuple[Dict[str, pd.DataFrame], Dict]:
+    """
+    Разворачивает зависимости, загружает базовые сигналы и считает синтетические
+    (через общий кэш формул). Возвращает ({signal: DataFrame[datetime, value]}, meta).
+    """
+    folder = STATE["settings"].get("signalArchiveFolder")
+    if not folder:
+        raise HTTPException(status_code=500, detail="signalArchiveFolder not configured")
+
+    base_signals, synthetic_signals = resolve_signal_dependencies(signal_names)
+    computation_levels = topological_levels(synthetic_signals)
+    computation_order = [name for level in computation_levels for name in level]
+
+    signals_data = load_signal_data_optimized(list(base_signals), folder, start=start, end=end) if base_signals else {}
+
+    report = None
+    if synthetic_signals:
+        refresh_table_frames()
+        df_all = build_wide_frame(signals_data).set_index("datetime") if signals_data else pd.DataFrame()
+        # колонки уже float64 — помечаем кадр, формулы не очищают их повторно
+        df_all = coerce_signal_frame(df_all)
+        cache_keys = formula_cache_keys(
+            synthetic_signals,
+            computation_order,
+            signal_fingerprints(list(base_signals), start, end),
+            _format_time_param(start),
+            _format_time_param(end),
+            df_all.index,
+        )
+        started = time.perf_counter()
+        report = compute_synthetic_signals(
+            df_all, synthetic_signals, computation_levels,
+            cache=get_formula_cache(), cache_keys=cache_keys, executor=get_compute_pool(),
+        )
+        print(f"[OK] Synthetic signals: {len(report.computed)} computed, {len(report.cached)} from cache, "
+              f"{len(report.failed)} failed in {time.perf_counter() - started:.2f}s "
+              f"({len(computation_levels)} levels)")
+        for name in report.computed + report.cached:
+            signals_data[name] = pd.DataFrame({"datetime": df_all.index, "value": df_all[name].to_numpy()})
+
+    wanted = list(dict.fromkeys(signal_names))
+    if include_dependencies:
+        wanted += [s for s in list(base_signals) + computation_order if s not in wanted]
+    out = {name: signals_data[name] for name in wanted if name in signals_data}
+
+    meta = {
+        "found": list(out.keys()),
+        "not_found": [s for s in wanted if s not in out],
+        "base_signals": sorted(base_signals),
+        "computation_order": computation_order,
+        "computation_levels": computation_levels,
+    }
+    if report is not None:
+        meta.update({
+            "computed": report.computed,
+            "cached": report.cached,
+            "failed": report.failed,
+            "warnings": report.warnings[:50],
+        })
+    if start is not None or end is not None:
+        meta["range"] = [_format_time_param(start), _format_time_param(end)]
+    return out, meta
+
+
+@app.post("/api/compute-signals")
+async def api_compute_signals(request: Request):
+    """Загружает и считает сигналы (включая синтетические) на сервере, результат — как у /api/signal-data"""
+    try:
+        data = await request.json()
+        signal_names = data.get("signals", [])
+        output_format = data.get("format", "arrow")
+        layout = _parse_layout(data)
+        include_dependencies = bool(data.get("include_dependencies", False))
+        start = _parse_time_param(data.get("start"), "start")
+        end = _parse_time_param(data.get("end"), "end")
+
+        if not signal_names:
+            raise HTTPException(status_code=400, detail="signals is required")
+
+        print(f"[INFO] Computing signals: {signal_names}")
+        signals_data, response = await run_in_threadpool(
+            compute_signals, signal_names, start, end, include_dependencies
+        )
+        response["format"] = output_format
+
+        if not signals_data:
+            raise HTTPException(status_code=404, detail="No signals found")
+
+        if output_format == "arrow":
+            return await _export_arrow(signals_data, response, layout)
+        elif output_format == "parquet":
+            return await _export_parquet(signals_data, response, layout)
+        else:
+            return await _export_json(signals_data, response)
+
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        print(f"[ERROR] compute-signals failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/formula-cache/status")
+def api_formula_cache_status():
+    """Счётчики кэша формул: попадания (в памяти и на диске), промахи, вытеснения"""
+    return get_formula_cache().stats()
+
+
 # =============================================================================
 # API — ВИЗУАЛИЗАТОР
 # =============================================================================
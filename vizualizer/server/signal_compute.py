@@ -0,0 +1,191 @@
+# signal_compute.py — расчёт синтетических сигналов по графу зависимостей
+
+import threading
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from code_signal import code_input_names, compute_code_signal, registered_tables, sanitize_numeric_column
+from formula_cache import FormulaCache, frame_fingerprint, index_fingerprint, make_formula_key
+from iapws97 import steam_functions_version
+from streaming_signal import compute_streaming_signal
+
+
+def read_table_excel(source) -> pd.DataFrame:
+    """Читает таблицу GETPOINT из xlsx (путь или BytesIO): первая строка — заголовок"""
+    df = pd.read_excel(source, engine="openpyxl")
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.dropna(axis=1, how="all")
+
+
+# =============================================================================
+# КЛЮЧИ КЭША
+# =============================================================================
+
+def formula_cache_keys(
+    synthetic_signals: Dict[str, Dict],
+    computation_order: List[str],
+    fingerprints: Dict[str, str],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    index: Optional[pd.Index] = None,
+) -> Dict[str, str]:
+    """
+    Ключи кэша синтетических сигналов в порядке вычисления:
+    вход — отпечаток архива (базовый сигнал) или ключ (синтетический).
+    index — ось времени расчёта (df_all.index): тот же сигнал на другой оси — другой ключ.
+    """
+    keys = {}
+    tables = ",".join(f"{name}:{frame_fingerprint(df)}" for name, df in sorted(registered_tables().frames.items()))
+    common = [f"steam={steam_functions_version()}"]
+    if index is not None:
+        common.append(f"index={index_fingerprint(index)}")
+    known = set(fingerprints) | set(synthetic_signals)
+    for syn_name in computation_order:
+        syn_data = synthetic_signals[syn_name]
+        formula = syn_data.get("formula", "")
+        inputs = {}
+        for dep in list(syn_data.get("dependencies", [])) + code_input_names(formula, known):
+            if dep == syn_name:
+                continue
+            inputs[dep] = fingerprints.get(dep) or keys.get(dep) or "missing"
+        extra = common + ([f"tables={tables}"] if "GETPOINT" in formula.upper() else [])
+        keys[syn_name] = make_formula_key(formula, inputs, start, end, extra)
+    return keys
+
+
+# =============================================================================
+# ОДИН РАСЧЁТ НА КЛЮЧ
+# =============================================================================
+#
+# Одновременные запросы одного и того же сигнала (несколько вкладок, несколько
+# инженеров с одним дашбордом) ждут первый расчёт и берут результат из кэша.
+
+_inflight_lock = threading.Lock()
+_inflight: Dict[str, list] = {}  # key -> [Lock, число ожидающих]
+
+
+@contextmanager
+def _single_flight(key: Optional[str]):
+    if key is None:
+        yield
+        return
+    with _inflight_lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _inflight.pop(key, None)
+
+
+# =============================================================================
+# РАСЧЁТ
+# =============================================================================
+
+@dataclass
+class ComputeReport:
+    computed: List[str] = field(default_factory=list)
+    cached: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    warnings: List[str] = field(default_factory=list)
+
+
+def is_self_referential(syn_name: str, syn_data: Dict) -> bool:
+    """Сигнал ссылается сам на себя — считается потоково"""
+    return syn_name in syn_data.get("dependencies", [])
+
+
+def _compute_one(
+    df_all: pd.DataFrame,
+    syn_name: str,
+    syn_data: Dict,
+    cache: Optional[FormulaCache],
+    key: Optional[str],
+) -> Tuple[str, Optional[pd.Series], List[str], Optional[str]]:
+    """
+    Считает один сигнал, df_all только читается (безопасно из нескольких потоков).
+    Возвращает (status: computed | cached | failed, series, warnings, error).
+    """
+    formula = syn_data.get("formula", "")
+    if not formula or df_all.empty:
+        return "failed", None, [], "пустая формула или нет данных"
+
+    warnings: List[str] = []
+    with _single_flight(key):
+        cached = cache.get(key, df_all.index) if key else None
+        if cached is not None:
+            cached.name = syn_name
+            return "cached", cached, warnings, None
+
+        # формуле передаются только её входы, а не весь кадр
+        df_inputs = df_all[code_input_names(formula, df_all.columns)]
+        try:
+            if is_self_referential(syn_name, syn_data):
+                series = compute_streaming_signal(formula=formula, df_base=df_inputs, signal_name=syn_name)
+            else:
+                series = compute_code_signal(
+                    formula, df_inputs,
+                    warn_callback=lambda msg: warnings.append(f"[{syn_name}] {msg}"),
+                )
+                series.name = syn_name
+        except Exception as e:
+            return "failed", None, warnings, str(e)
+        # float64, чтобы df_all оставался числовым кадром (coerce_signal_frame)
+        series = sanitize_numeric_column(series).astype(np.float64)
+
+        if key:
+            cache.put(key, series)
+    return "computed", series, warnings, None
+
+
+def compute_synthetic_signals(
+    df_all: pd.DataFrame,
+    synthetic_signals: Dict[str, Dict],
+    computation_levels: List[List[str]],
+    cache: Optional[FormulaCache] = None,
+    cache_keys: Optional[Dict[str, str]] = None,
+    executor: Optional[Executor] = None,
+    on_progress: Callable[[str, int, int], None] = lambda name, done, total: None,
+) -> ComputeReport:
+    """
+    Считает синтетические сигналы по уровням графа зависимостей и дописывает их колонками в df_all.
+    Сигналы одного уровня друг от друга не зависят и при заданном executor считаются параллельно;
+    колонки в df_all добавляются после завершения уровня.
+    Самоссылающиеся — потоково, остальные — пакетно.
+    При заданном кэше готовые сигналы берутся из него, новые — сохраняются.
+    """
+    report = ComputeReport()
+    cache_keys = cache_keys or {}
+    total = sum(len(level) for level in computation_levels)
+    done = 0
+
+    def run(syn_name: str):
+        key = cache_keys.get(syn_name) if cache is not None else None
+        return _compute_one(df_all, syn_name, synthetic_signals[syn_name], cache, key)
+
+    for level in computation_levels:
+        if executor is None or len(level) == 1:
+            outcomes = [run(syn_name) for syn_name in level]
+        else:
+            outcomes = list(executor.map(run, level))
+
+        for syn_name, (status, series, warnings, error) in zip(level, outcomes):
+            report.warnings.extend(warnings)
+            if status == "failed":
+                report.failed[syn_name] = error
+            else:
+                df_all[syn_name] = series
+                (report.cached if status == "cached" else report.computed).append(syn_name)
+            done += 1
+            on_progress(syn_name, done, total)
+
+    return report
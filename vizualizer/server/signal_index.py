@@ -0,0 +1,271 @@
+# signal_index.py — индекс архива сигналов в SQLite
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from archive_store import read_archive_header, read_archive_time_range
+
+
+# Версия схемы: при несовпадении база пересоздаётся и файлы сканируются заново
+SCHEMA_VERSION = 2
+
+# Не больше стольких параметров в одном IN (...) — лимит переменных SQLite
+QUERY_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id      INTEGER PRIMARY KEY,
+    name    TEXT NOT NULL UNIQUE,   -- имя файла относительно папки архива
+    mtime   REAL NOT NULL,
+    t_start INTEGER,                -- покрытие файла по времени, нс
+    t_end   INTEGER
+);
+CREATE TABLE IF NOT EXISTS signals (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS signal_files (
+    signal_id INTEGER NOT NULL REFERENCES signals(id),
+    file_id   INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    PRIMARY KEY (signal_id, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS signal_files_by_file ON signal_files(file_id);
+CREATE TABLE IF NOT EXISTS failed_files (
+    name  TEXT PRIMARY KEY,         -- не проиндексирован: повторно — только после изменения mtime
+    mtime REAL NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+
+class SignalIndex:
+    """
+    Индекс signal_name -> файлы архива с покрытием по времени.
+    Хранится в SQLite, запросы выполняются лениво — в память целиком не загружается.
+    Пути хранятся относительно папки архива, поэтому база переносима.
+    """
+
+    def __init__(self, db_path: str, folder_abs: str):
+        self.db_path = db_path
+        self.folder_abs = folder_abs
+        self._lock = threading.Lock()
+        self._conn = self._open()
+
+    # ------------------------------------------------------------------
+    # Схема
+    # ------------------------------------------------------------------
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+
+        version = None
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            version = int(row[0]) if row else None
+        except sqlite3.DatabaseError:
+            pass
+
+        if version != SCHEMA_VERSION:
+            if version is not None:
+                print(f"[INFO] Signal index schema {version} -> {SCHEMA_VERSION}, rebuilding...")
+            conn.executescript(
+                "DROP TABLE IF EXISTS failed_files;"
+                "DROP TABLE IF EXISTS signal_files;"
+                "DROP TABLE IF EXISTS signals;"
+                "DROP TABLE IF EXISTS files;"
+                "DROP TABLE IF EXISTS meta;"
+            )
+            conn.executescript(SCHEMA)
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES ('schema_version', ?)",
+                (str(SCHEMA_VERSION),),
+            )
+            conn.commit()
+        return conn
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Обновление
+    # ------------------------------------------------------------------
+
+    def sync(self) -> Tuple[List[str], List[str]]:
+        """
+        Сверяет базу с папкой архива: сканирует только новые и изменённые CSV,
+        удаляет исчезнувшие. Возвращает (обновлённые файлы, удалённые файлы).
+        """
+        if not os.path.isdir(self.folder_abs):
+            raise FileNotFoundError(f"Signal data folder not found: {self.folder_abs}")
+
+        current = {}
+        for name in os.listdir(self.folder_abs):
+            if name.lower().endswith(".csv"):
+                current[name] = os.path.getmtime(os.path.join(self.folder_abs, name))
+
+        with self._lock:
+            known = dict(self._conn.execute("SELECT name, mtime FROM files"))
+            failed_before = dict(self._conn.execute("SELECT name, mtime FROM failed_files"))
+
+        updated = sorted(
+            name for name, mtime in current.items()
+            if known.get(name) != mtime and failed_before.get(name) != mtime
+        )
+        removed = sorted(set(known) - set(current))
+        forgotten = sorted(set(failed_before) - set(current))
+
+        # чтение заголовков — вне блокировки, запросы к индексу продолжают работать
+        scanned = []
+        failed = []
+        for name in updated:
+            filepath = os.path.join(self.folder_abs, name)
+            try:
+                columns = read_archive_header(filepath)
+                t_start, t_end = read_archive_time_range(filepath)
+            except Exception as e:
+                print(f"  ✗ Failed to index {name}: {e}")
+                failed.append((name, current[name], str(e)))
+                continue
+            scanned.append((name, current[name], columns, t_start, t_end))
+            print(f"  ✓ {name}: {len(columns)} signals{' (updated)' if name in known else ''}")
+
+        if not scanned and not removed and not failed and not forgotten:
+            return [], []
+
+        with self._lock, self._conn:
+            for name in removed:
+                self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+            for name in forgotten:
+                self._conn.execute("DELETE FROM failed_files WHERE name = ?", (name,))
+            for name, mtime, error in failed:
+                # прежняя версия файла из индекса убирается — прочитать его нельзя
+                self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO failed_files(name, mtime, error) VALUES (?, ?, ?)",
+                    (name, mtime, error),
+                )
+            for name, mtime, columns, t_start, t_end in scanned:
+                self._conn.execute("DELETE FROM failed_files WHERE name = ?", (name,))
+                self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                file_id = self._conn.execute(
+                    "INSERT INTO files(name, mtime, t_start, t_end) VALUES (?, ?, ?, ?)",
+                    (name, mtime, t_start, t_end),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO signals(name) VALUES (?)",
+                    ((c,) for c in columns),
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO signal_files(signal_id, file_id) "
+                    "SELECT id, ? FROM signals WHERE name = ?",
+                    ((file_id, c) for c in columns),
+                )
+            self._conn.execute(
+                "DELETE FROM signals WHERE id NOT IN (SELECT DISTINCT signal_id FROM signal_files)"
+            )
+
+        if removed:
+            print(f"  – removed from index: {', '.join(removed)}")
+        return [s[0] for s in scanned], removed
+
+    # ------------------------------------------------------------------
+    # Запросы
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signals").fetchone()[0]
+
+    def __contains__(self, signal_name: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM signals WHERE name = ?", (signal_name,)).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            names = [r[0] for r in self._conn.execute("SELECT name FROM signals ORDER BY name")]
+        return iter(names)
+
+    def file_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def file_names(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT name FROM files ORDER BY name")]
+
+    def files_for(
+        self,
+        signal_names: List[str],
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        {filepath: [сигналы из запроса в файле]}. При заданном окне start_ns..end_ns
+        возвращаются только файлы, покрытие которых пересекается с окном.
+        """
+        names = list(dict.fromkeys(signal_names))
+        if not names:
+            return {}
+
+        sql = (
+            "SELECT f.name, s.name FROM signals s "
+            "JOIN signal_files sf ON sf.signal_id = s.id "
+            "JOIN files f ON f.id = sf.file_id "
+            "WHERE s.name IN ({})"
+        )
+        window: list = []
+        if start_ns is not None:
+            sql += " AND f.t_end >= ?"
+            window.append(start_ns)
+        if end_ns is not None:
+            sql += " AND f.t_start <= ?"
+            window.append(end_ns)
+
+        rows = []
+        with self._lock:
+            for offset in range(0, len(names), QUERY_CHUNK):
+                chunk = names[offset:offset + QUERY_CHUNK]
+                rows += self._conn.execute(sql.format(",".join("?" * len(chunk))), chunk + window).fetchall()
+        rows.sort(key=lambda row: row[0])
+
+        out: Dict[str, List[str]] = {}
+        for file_name, signal_name in rows:
+            out.setdefault(os.path.join(self.folder_abs, file_name), []).append(signal_name)
+        return out
+
+    def fingerprints(
+        self,
+        signal_names: List[str],
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+    ) -> Dict[str, str]:
+        """
+        {signal: отпечаток} — хэш имён и mtime файлов, из которых сигнал читается
+        в окне start_ns..end_ns. Меняется при любом изменении этих файлов.
+        """
+        files = self.files_for(signal_names, start_ns, end_ns)
+        with self._lock:
+            mtimes = dict(self._conn.execute("SELECT name, mtime FROM files"))
+
+        parts: Dict[str, List[str]] = {}
+        for filepath, names in files.items():
+            file_name = os.path.basename(filepath)
+            for name in names:
+                parts.setdefault(name, []).append(f"{file_name}:{mtimes.get(file_name)!r}")
+
+        return {
+            name: hashlib.sha1("|".join(parts[name]).encode("utf-8")).hexdigest()
+            for name in dict.fromkeys(signal_names)
+            if name in parts
+        }
@@ -0,0 +1,592 @@
+# streaming_signal.py — потоковый расчёт самоссылающихся синтетических сигналов
+
+import math
+from collections import deque
+from functools import partial
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from code_parser import (
+    BinOp,
+    Call,
+    CodeSyntaxError,
+    Compare,
+    Logic,
+    Name,
+    Num,
+    Str,
+    Unary,
+    emit_expression,
+    iter_nodes,
+    parse_code,
+)
+from code_signal import (
+    CodeEvaluationError,
+    _special_signal_names,
+    numeric_column,
+    registered_tables,
+    rolling_slope,
+    table_curves,
+)
+from iapws97 import STEAM_FUNCTIONS
+
+
+# =============================================================================
+# СКОЛЬЗЯЩИЕ АГРЕГАТЫ HISTORY*(self / expr)
+# =============================================================================
+
+class RingAggregate:
+    """
+    HISTORY* по последним `period` значениям сигнала или выражения (NaN занимают место в окне,
+    но в агрегат не входят). Обновление и чтение — O(1) амортизированно:
+    AVG/SUM/COUNT — текущие сумма и число значений,
+    MAX/MIN/DIFF — монотонные очереди,
+    GRADIENT — суммы для МНК по x = номер непустого значения (0..m-1 в окне).
+    Суммы раз в `period` шагов пересчитываются по окну, чтобы не копилась погрешность.
+    """
+
+    def __init__(self, func: str, period: int):
+        self.func = func
+        self.period = period
+        self._step = 0
+        self._rank = 0
+        self._since_sync = 0
+        self._window = deque()  # (шаг, значение, номер непустого значения)
+        self._max = deque()
+        self._min = deque()
+        # суммы считаются от опорных y_ref и rank_ref — так меньше потеря точности
+        self._y_ref = 0.0
+        self._rank_ref = 0
+        self._sum = 0.0
+        self._sum_ry = 0.0
+
+    def push(self, value: float):
+        self._step += 1
+        if not math.isnan(value):
+            entry = (self._step, value, self._rank)
+            self._rank += 1
+            self._window.append(entry)
+            self._add(entry)
+            if self.func in ("HISTORYMAX", "HISTORYDIFF"):
+                while self._max and self._max[-1][1] <= value:
+                    self._max.pop()
+                self._max.append(entry)
+            if self.func in ("HISTORYMIN", "HISTORYDIFF"):
+                while self._min and self._min[-1][1] >= value:
+                    self._min.pop()
+                self._min.append(entry)
+
+        limit = self._step - self.period
+        while self._window and self._window[0][0] <= limit:
+            self._remove(self._window.popleft())
+        while self._max and self._max[0][0] <= limit:
+            self._max.popleft()
+        while self._min and self._min[0][0] <= limit:
+            self._min.popleft()
+
+        self._since_sync += 1
+        if self._since_sync >= self.period:
+            self._resync()
+
+    def _add(self, entry):
+        _, value, rank = entry
+        y = value - self._y_ref
+        self._sum += y
+        self._sum_ry += (rank - self._rank_ref) * y
+
+    def _remove(self, entry):
+        _, value, rank = entry
+        y = value - self._y_ref
+        self._sum -= y
+        self._sum_ry -= (rank - self._rank_ref) * y
+
+    def _resync(self):
+        self._since_sync = 0
+        self._sum = 0.0
+        self._sum_ry = 0.0
+        if self._window:
+            self._y_ref = self._window[0][1]
+            self._rank_ref = self._window[0][2]
+        for entry in self._window:
+            self._add(entry)
+
+    def value(self) -> float:
+        m = len(self._window)
+        if m == 0:
+            return np.nan
+
+        func = self.func
+        if func == "HISTORYAVG":
+            return self._y_ref + self._sum / m
+        elif func == "HISTORYSUM":
+            return self._y_ref * m + self._sum
+        elif func == "HISTORYCOUNT":
+            return float(m)
+        elif func == "HISTORYMAX":
+            return self._max[0][1]
+        elif func == "HISTORYMIN":
+            return self._min[0][1]
+        elif func == "HISTORYDIFF":
+            return self._max[0][1] - self._min[0][1]
+        elif func == "HISTORYGRADIENT":
+            if m < 2:
+                return np.nan
+            # x_j = j = rank - rank_первого в окне; Σx, m·Σx² − (Σx)² — в замкнутом виде
+            offset = self._window[0][2] - self._rank_ref
+            sum_xy = self._sum_ry - offset * self._sum
+            sum_x = m * (m - 1) / 2.0
+            denom = m * m * (m * m - 1) / 12.0
+            return (m * sum_xy - sum_x * self._sum) / denom
+        return np.nan
+
+
+# =============================================================================
+# СКАЛЯРНЫЕ ФУНКЦИИ CODE
+# =============================================================================
+
+HISTORY_FUNCTIONS = (
+    "HISTORYAVG", "HISTORYSUM", "HISTORYCOUNT",
+    "HISTORYMAX", "HISTORYMIN", "HISTORYDIFF", "HISTORYGRADIENT",
+)
+
+
+def _safe_float(v):
+    if v is None:
+        return np.nan
+    try:
+        f = float(v)
+        return f
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _is_nan(v):
+    try:
+        return np.isnan(v)
+    except (TypeError, ValueError):
+        return True
+
+
+def _truth(v) -> bool:
+    # как astype(bool) в пакетном режиме и bool() в WHEN: NaN — истина, ложь только 0
+    return _safe_float(v) != 0
+
+
+def WHEN(cond, t_val, f_val):
+    try:
+        return t_val if bool(cond) else f_val
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def ABS(a):
+    a = _safe_float(a)
+    return np.abs(a) if not _is_nan(a) else np.nan
+
+
+def EXP(a):
+    a = _safe_float(a)
+    return np.exp(a) if not _is_nan(a) else np.nan
+
+
+def POW(a, b):
+    a, b = _safe_float(a), _safe_float(b)
+    if _is_nan(a) or _is_nan(b):
+        return np.nan
+    return np.power(a, b)
+
+
+def LOG(a):
+    a = _safe_float(a)
+    return np.log(a) if (not _is_nan(a) and a > 0) else np.nan
+
+
+def LOG10(a):
+    a = _safe_float(a)
+    return np.log10(a) if (not _is_nan(a) and a > 0) else np.nan
+
+
+def MIN(*args):
+    vals = [_safe_float(a) for a in args]
+    vals = [v for v in vals if not _is_nan(v)]
+    return min(vals) if vals else np.nan
+
+
+def MAX(*args):
+    vals = [_safe_float(a) for a in args]
+    vals = [v for v in vals if not _is_nan(v)]
+    return max(vals) if vals else np.nan
+
+
+def AVG(*args):
+    vals = [_safe_float(a) for a in args]
+    vals = [v for v in vals if not _is_nan(v)]
+    return sum(vals) / len(vals) if vals else np.nan
+
+
+def MED(*args):
+    vals = [_safe_float(a) for a in args]
+    vals = [v for v in vals if not _is_nan(v)]
+    return float(np.median(vals)) if vals else np.nan
+
+
+def ROUND(a, b=0):
+    """Как np.round в пакетном режиме: масштаб 10^b, округление половины к чётному, NaN в b -> 0"""
+    a = _safe_float(a)
+    if not math.isfinite(a):
+        return a
+    b = _safe_float(b)
+    decimals = 0 if _is_nan(b) else int(round(b))
+    if decimals >= 0:
+        scale = 10.0 ** decimals
+        return round(a * scale) / scale
+    scale = 10.0 ** -decimals
+    return round(a / scale) * scale
+
+
+def GETPOINT(curveName, pointX, pointY, axisToFind, tables=None):
+    curves, _ = table_curves(str(curveName), tables)
+    if curves is None:
+        return np.nan
+
+    axis = str(axisToFind).strip().upper()
+    if axis == "Y":
+        return curves.x_to_y.at(_safe_float(pointX))
+    if axis == "X":
+        return curves.y_to_x.at(_safe_float(pointY))
+    return np.nan
+
+
+SCALAR_FUNCTIONS = {
+    "WHEN": WHEN,
+    "ABS": ABS,
+    "EXP": EXP,
+    "POW": POW,
+    "LOG": LOG,
+    "LOG10": LOG10,
+    "MIN": MIN,
+    "MAX": MAX,
+    "AVG": AVG,
+    "MED": MED,
+    "ROUND": ROUND,
+    "GETPOINT": GETPOINT,
+    **STEAM_FUNCTIONS,
+    "__and__": lambda a, b: _truth(a) and _truth(b),
+    "__or__": lambda a, b: _truth(a) or _truth(b),
+    "__not__": lambda a: not _truth(a),
+}
+
+
+# =============================================================================
+# КОМПИЛЯЦИЯ ПОТОКОВОЙ ФОРМУЛЫ
+# =============================================================================
+#
+# Формула разбирается парсером CODE, вызовы PREV и HISTORY* заменяются
+# идентификаторами с состоянием, которое продвигается на один шаг за строку:
+#   PREV(self)              -> значение сигнала на предыдущем шаге
+#   PREV(other)             -> предвычисленный сдвинутый массив
+#   HISTORY*(other, N)      -> предвычисленный rolling-массив
+#   PREV(expr)              -> значение expr на предыдущем шаге
+#   HISTORY*(self|expr, N)  -> RingAggregate (O(1) на шаг)
+# expr — любое выражение CODE, в том числе с вложенными PREV/HISTORY*.
+# Окно HISTORY* в потоковом режиме — N последних точек (строк) при любом индексе,
+# как в прежнем потоковом расчёте; в пакетном режиме на datetime-индексе это N минут.
+# Если expr зависит от самого сигнала, оно вычисляется после значения сигнала
+# на текущем шаге, и окно HISTORY* состоит из предыдущих шагов (как у self);
+# иначе — до него, и текущий шаг входит в окно.
+#
+# Из дерева генерируется одна функция с циклом по строкам:
+#
+#     def _stream(n, result, A, R, F, nan):
+#         a0, a1, = A          # колонки (списки float)
+#         rv0, rp0, = R        # value / push кольцевых агрегатов
+#         f0, = F              # скалярные функции
+#         prev_self = nan
+#         for i in range(n):
+#             h0 = rv0()
+#             try:
+#                 v = float(f0((a0[i] > 0), (prev_self + h0), a1[i]))
+#             except Exception:
+#                 v = nan
+#             result[i] = v
+#             rp0(v)
+#             prev_self = v
+#
+# Время расчёта линейно по числу строк, накладные расходы на строку —
+# вызов функций формулы, без построения окружения.
+
+_PREV_SELF = "__prev_self__"
+_KERNEL_BUILTINS = {"range": range, "float": float, "Exception": Exception}
+
+
+def _signal_arg(node, columns) -> str | None:
+    """Имя сигнала из аргумента PREV/HISTORY*: A или 'A'"""
+    if isinstance(node, Name) and node.name in columns:
+        return node.name
+    if isinstance(node, Str) and node.value in columns:
+        return node.value
+    return None
+
+
+def _rewrite_stream_tree(tree, signal_name: str, columns, specs: Dict[str, tuple]):
+    """
+    Заменяет PREV/HISTORY* на идентификаторы, specs: token -> описание.
+    Токены добавляются в specs после вложенных (порядок вычисления).
+    """
+    def token_for(spec: tuple) -> str:
+        for token, known in specs.items():
+            if known == spec:
+                return token
+        token = f"__stream{len(specs)}__"
+        specs[token] = spec
+        return token
+
+    def after_self(node) -> bool:
+        """Выражение зависит от значения сигнала на текущем шаге"""
+        for item in iter_nodes(node):
+            if isinstance(item, Name):
+                if item.name in (signal_name, _PREV_SELF):
+                    return True
+                spec = specs.get(item.name)
+                if spec is not None and spec[0] in ("ring", "state") and spec[-1]:
+                    return True
+        return False
+
+    def rewrite(node):
+        if isinstance(node, Call):
+            func = node.func.upper()
+            if func == "PREV" or func in HISTORY_FUNCTIONS:
+                return rewrite_stateful(func, node)
+            return Call(node.func, tuple(rewrite(arg) for arg in node.args))
+        if isinstance(node, Unary):
+            return Unary(node.op, rewrite(node.operand))
+        if isinstance(node, (BinOp, Compare, Logic)):
+            return type(node)(node.op, rewrite(node.left), rewrite(node.right))
+        return node
+
+    def rewrite_stateful(func: str, node: Call):
+        if func == "PREV":
+            if len(node.args) != 1:
+                raise CodeEvaluationError("PREV принимает один аргумент")
+        elif len(node.args) != 2:
+            raise CodeEvaluationError(f"{func} принимает два аргумента: (сигнал, период)")
+
+        target = _signal_arg(node.args[0], columns)
+        if func == "PREV":
+            if target == signal_name:
+                return Name(_PREV_SELF)
+            if target is not None:
+                return Name(token_for(("prev", target)))
+            arg = rewrite(node.args[0])
+            return Name(token_for(("state", arg, after_self(arg))))
+
+        period_node = node.args[1]
+        if not isinstance(period_node, Num) or int(period_node.value) <= 0:
+            raise CodeEvaluationError(f"{func}: период должен быть положительным числом")
+        period = int(period_node.value)
+        if target is not None and target != signal_name:
+            return Name(token_for(("history", func, target, period)))
+        arg = Name(signal_name) if target == signal_name else rewrite(node.args[0])
+        return Name(token_for(("ring", func, period, arg, after_self(arg))))
+
+    return rewrite(tree)
+
+
+def _history_other(func_name: str, series: pd.Series, period: int) -> np.ndarray:
+    """HISTORY* полностью известного сигнала по `period` последним точкам"""
+    rolling = series.rolling(period, min_periods=1)
+    if func_name == "HISTORYAVG":
+        rolled = rolling.mean()
+    elif func_name == "HISTORYSUM":
+        rolled = rolling.sum()
+    elif func_name == "HISTORYCOUNT":
+        rolled = rolling.count()
+    elif func_name == "HISTORYMAX":
+        rolled = rolling.max()
+    elif func_name == "HISTORYMIN":
+        rolled = rolling.min()
+    elif func_name == "HISTORYDIFF":
+        rolled = rolling.max() - rolling.min()
+    elif func_name == "HISTORYGRADIENT":
+        rolled = _precompute_gradient(series, period)
+    else:
+        rolled = pd.Series(np.nan, index=series.index)
+    return rolled.to_numpy(dtype=np.float64)
+
+
+def compute_streaming_signal(
+    formula: str,
+    df_base: pd.DataFrame,
+    signal_name: str,
+) -> pd.Series:
+    """
+    Потоковый расчёт самоссылающегося сигнала.
+    Все зависимости уже в df_base (посчитаны пакетно).
+    Один проход по строкам, O(n): формула компилируется в функцию с циклом.
+    """
+    index = df_base.index
+    n = len(index)
+    columns = set(map(str, df_base.columns)) | {signal_name}
+    tables = registered_tables()
+
+    try:
+        tree = parse_code(formula, _special_signal_names(columns))
+    except CodeSyntaxError as exc:
+        raise CodeEvaluationError(str(exc)) from exc
+
+    specs: Dict[str, tuple] = {}
+    tree = _rewrite_stream_tree(tree, signal_name, columns, specs)
+
+    # ---------- входные массивы: только то, на что ссылается формула ----------
+    numeric_cache: Dict[str, pd.Series] = {}
+
+    def numeric(name: str) -> pd.Series:
+        if name not in numeric_cache:
+            numeric_cache[name] = numeric_column(df_base, name)
+        return numeric_cache[name]
+
+    arrays: Dict[str, str] = {}
+    array_values: List[list] = []
+    functions: Dict[str, str] = {}
+    # текст подстановки имени сигнала: до расчёта шага его значение ещё неизвестно
+    self_expr = "nan"
+
+    def add_array(key: str, values: np.ndarray) -> str:
+        if key not in arrays:
+            arrays[key] = f"a{len(arrays)}"
+            # списки float: поэлементный доступ и арифметика быстрее, чем у numpy-скаляров
+            array_values.append(np.asarray(values, dtype=np.float64).tolist())
+        return f"{arrays[key]}[i]"
+
+    stateful = {token: f"h{k}" for k, token in enumerate(
+        token for token, spec in specs.items() if spec[0] in ("ring", "state")
+    )}
+
+    def name_expr(name: str) -> str:
+        if name == _PREV_SELF:
+            return "prev_self"
+        if name in stateful:
+            return stateful[name]
+        spec = specs.get(name)
+        if spec is not None:
+            if spec[0] == "prev":
+                return add_array(name, numeric(spec[1]).shift(1).to_numpy(dtype=np.float64))
+            _, func_name, target, period = spec
+            return add_array(name, _history_other(func_name, numeric(target), period))
+        if name == signal_name:
+            return self_expr
+        if name in columns:
+            return add_array(name, numeric(name).to_numpy(dtype=np.float64))
+        if name in ("X", "Y") or name in tables.frames:
+            return repr(name)
+        if name.upper() in ("TRUE", "FALSE"):
+            return "1.0" if name.upper() == "TRUE" else "0.0"
+        if name.startswith("np."):
+            value = getattr(np, name[3:], None)
+            if isinstance(value, (int, float)):
+                return repr(float(value))
+        raise CodeEvaluationError(f"name '{name}' is not defined")
+
+    def func_var(name: str) -> str:
+        if name not in functions:
+            if name not in SCALAR_FUNCTIONS and not (
+                name.startswith("np.") and callable(getattr(np, name[3:], None))
+            ):
+                raise CodeEvaluationError(f"name '{name}' is not defined")
+            functions[name] = f"f{len(functions)}"
+        return functions[name]
+
+    def emit_value(node, target: str, indent: str) -> List[str]:
+        """Вычисление выражения в переменную target, ошибка -> NaN"""
+        assignments, body, _ = emit_expression(node, name_expr, func_var)
+        return [
+            f"{indent}try:",
+            *(f"{indent}    {line}" for line in assignments),
+            f"{indent}    {target} = float({body})",
+            f"{indent}except Exception:",
+            f"{indent}    {target} = nan",
+        ]
+
+    # ---------- состояние PREV(expr) / HISTORY*(expr): до и после шага ----------
+    rings: List[RingAggregate] = []
+    state_names: List[str] = []
+    before: List[str] = []      # чтение состояния / обновление по expr без self
+    after: List[str] = []       # обновление по expr, зависящим от self
+    after_apply: List[str] = []
+
+    for token, var in stateful.items():
+        spec = specs[token]
+        k = var[1:]
+        post = spec[-1]
+        if spec[0] == "state":
+            arg = spec[1]
+            state_names.append(f"s{k}")
+            before.append(f"        {var} = s{k}")
+            if not post:
+                before.extend(emit_value(arg, f"s{k}", "        "))
+                continue
+            apply = f"        s{k} = e{k}"
+        else:
+            _, func_name, period, arg, _ = spec
+            rings.append(RingAggregate(func_name, period))
+            r = len(rings) - 1
+            if not post:
+                before.extend(emit_value(arg, f"e{k}", "        "))
+                before.append(f"        rp{r}(e{k})")
+                before.append(f"        {var} = rv{r}()")
+                continue
+            before.append(f"        {var} = rv{r}()")
+            apply = f"        rp{r}(e{k})"
+
+        # expr зависит от self: вычисляется, когда значение сигнала на шаге известно
+        self_expr = "v"
+        after.extend(emit_value(arg, f"e{k}", "        "))
+        self_expr = "nan"
+        after_apply.append(apply)
+
+    body_lines = emit_value(tree, "v", "        ")
+
+    lines = ["def _stream(n, result, A, R, F, nan):"]
+    if arrays:
+        lines.append(f"    {', '.join(arrays.values())}, = A")
+    if rings:
+        lines.append(f"    {', '.join(f'rv{k}, rp{k}' for k in range(len(rings)))}, = R")
+    if functions:
+        lines.append(f"    {', '.join(functions.values())}, = F")
+    lines.append("    prev_self = nan")
+    lines.extend(f"    {name} = nan" for name in state_names)
+    lines.append("    for i in range(n):")
+    lines.extend(before)
+    lines.extend(body_lines)
+    lines.append("        result[i] = v")
+    lines.extend(after)
+    lines.extend(after_apply)
+    lines.append("        prev_self = v")
+    lines.append("    return result")
+    source = "\n".join(lines)
+
+    namespace: Dict[str, object] = {}
+    exec(compile(source, "<streaming_formula>", "exec"), {"__builtins__": _KERNEL_BUILTINS}, namespace)
+
+    ring_refs = []
+    for ring in rings:
+        ring_refs.extend((ring.value, ring.push))
+    # GETPOINT привязывается к набору таблиц, взятому в начале расчёта
+    scalar_functions = {**SCALAR_FUNCTIONS, "GETPOINT": partial(GETPOINT, tables=tables)}
+    function_refs = [
+        scalar_functions[name] if name in scalar_functions else getattr(np, name[3:])
+        for name in functions
+    ]
+
+    result = [np.nan] * n
+    with np.errstate(all="ignore"):
+        namespace["_stream"](n, result, array_values, ring_refs, function_refs, np.nan)
+
+    return pd.Series(np.array(result, dtype=np.float64), index=index, name=signal_name)
+
+
+def _precompute_gradient(series: pd.Series, period: int) -> pd.Series:
+    """Предвычисляет градиент для полностью известного сигнала (пакетно)."""
+    return pd.Series(rolling_slope(series, period), index=series.index)
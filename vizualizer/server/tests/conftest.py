@@ -0,0 +1,8 @@
+# conftest.py — модули сервера импортируются как в main.py (плоско, из папки server)
+
+import os
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
@@ -0,0 +1,159 @@
+# test_archive_store.py — колоночное хранилище: CSV -> .npy -> те же данные
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from archive_store import (
+    ARCHIVE_ENCODING,
+    STORE_META,
+    ensure_archive_file,
+    ingest_archive_file,
+    load_archive_file,
+    load_signals_from_store,
+    merge_signal_frames,
+    prune_archive_store,
+    read_archive_csv,
+    read_archive_header,
+    read_archive_time_range,
+)
+
+
+SIGNALS = ["10MAA50CP001§§XM20", "C-1", "TEMP"]
+
+
+def write_archive_csv(path, start: str, rows: int, seed: int = 0, freq: str = "30min"):
+    """CSV в формате архива: ';', десятичная запятая, DATE + TIME с миллисекундами"""
+    rng = np.random.default_rng(seed)
+    dt = pd.date_range(start, periods=rows, freq=freq)
+    # строки вперемешку — хранилище должно отсортировать их по времени
+    order = rng.permutation(rows)
+    lines = [";".join(["DATE", "TIME", *SIGNALS])]
+    for i in order:
+        values = [f"{v:.8f}".replace(".", ",") for v in rng.normal(size=len(SIGNALS))]
+        if i % 5 == 0:
+            values[1] = ""
+        lines.append(";".join([dt[i].strftime("%d.%m.%Y"), dt[i].strftime("%H:%M:%S") + ",000", *values]))
+    with open(path, "w", encoding=ARCHIVE_ENCODING) as f:
+        f.write("\n".join(lines) + "\n")
+    return dt
+
+
+@pytest.fixture
+def archive(tmp_path):
+    folder = tmp_path / "archive"
+    folder.mkdir()
+    path = folder / "a.csv"
+    dt = write_archive_csv(path, "2024-01-01", 48)
+    return str(path), str(tmp_path / "cache"), dt
+
+
+def test_store_round_trip(archive):
+    path, cache, dt = archive
+    expected = read_archive_csv(path)
+    meta = ingest_archive_file(path, cache)
+    assert meta["rows"] == len(dt)
+    assert sorted(meta["columns"]) == sorted(SIGNALS)
+
+    loaded = load_signals_from_store(path, SIGNALS + ["missing"], cache)
+    assert sorted(loaded) == sorted(SIGNALS)
+    for name in SIGNALS:
+        frame = loaded[name]
+        assert list(frame.columns) == ["datetime", "value"]
+        np.testing.assert_array_equal(frame["datetime"].to_numpy(), expected["datetime"].to_numpy())
+        np.testing.assert_array_equal(frame["value"].to_numpy(), expected[name].to_numpy(dtype=np.float64))
+    assert frame["datetime"].is_monotonic_increasing
+    assert np.isnan(loaded["C-1"]["value"].to_numpy()).sum() == len(dt) // 5 + 1
+
+
+def test_store_is_rebuilt_when_csv_changes(archive):
+    path, cache, _ = archive
+    first = ensure_archive_file(path, cache)
+    assert ensure_archive_file(path, cache) == first
+
+    write_archive_csv(path, "2024-02-01", 10, seed=1)
+    os.utime(path, (first["mtime"] + 10, first["mtime"] + 10))
+    second = ensure_archive_file(path, cache)
+    assert second["data"] != first["data"]
+    assert second["rows"] == 10
+
+    store_dir = os.path.join(cache, os.path.basename(path))
+    with open(os.path.join(store_dir, STORE_META), encoding="utf-8") as f:
+        assert json.load(f) == second
+    # прежняя версия остаётся для читателей, уже открывших старый meta.json
+    assert os.path.isdir(os.path.join(store_dir, first["data"]))
+    loaded = load_signals_from_store(path, ["TEMP"], cache)
+    assert loaded["TEMP"]["datetime"].iloc[0] == pd.Timestamp("2024-02-01")
+
+
+def test_prune_removes_stale_entries(archive):
+    path, cache, _ = archive
+    ensure_archive_file(path, cache)
+    os.makedirs(os.path.join(cache, "gone.csv"))
+    assert prune_archive_store(cache, [path]) == 1
+    assert sorted(os.listdir(cache)) == ["a.csv"]
+
+
+def test_read_only_requested_columns(archive):
+    path, _, dt = archive
+    full = read_archive_csv(path)
+    df = read_archive_csv(path, columns=["TEMP", "missing"])
+    assert list(df.columns) == ["TEMP", "datetime"]
+    assert df["TEMP"].dtype == np.float64
+    np.testing.assert_array_equal(df["TEMP"].to_numpy(), full["TEMP"].to_numpy())
+    np.testing.assert_array_equal(df["datetime"].to_numpy(), dt.to_numpy())
+
+
+def test_load_archive_file_with_and_without_store(archive):
+    path, cache, _ = archive
+    name, from_store, seconds = load_archive_file(path, SIGNALS, cache)
+    assert name == path and seconds >= 0
+    _, from_csv, _ = load_archive_file(path, SIGNALS, None)
+    for signal in SIGNALS:
+        np.testing.assert_array_equal(from_store[signal]["datetime"].to_numpy(), from_csv[signal]["datetime"].to_numpy())
+        np.testing.assert_array_equal(from_store[signal]["value"].to_numpy(), from_csv[signal]["value"].to_numpy())
+
+
+def test_merge_signal_frames(archive, tmp_path):
+    path, cache, dt = archive
+    other = str(tmp_path / "archive" / "b.csv")
+    write_archive_csv(other, "2024-01-01 12:00", 48, seed=2)
+    parts = [
+        load_signals_from_store(p, ["TEMP"], cache)["TEMP"] for p in (path, other)
+    ]
+    merged = merge_signal_frames(parts)
+    assert merged["datetime"].is_monotonic_increasing
+    assert not merged["datetime"].duplicated().any()
+    assert len(merged) == 48 + 24
+    # на пересечении берётся значение первого файла
+    overlap = merged.set_index("datetime").loc[dt[30], "value"]
+    assert overlap == parts[0].set_index("datetime").loc[dt[30], "value"]
+
+
+def test_store_time_range(archive):
+    path, cache, dt = archive
+    start, end = dt[10], dt[20]
+    loaded = load_signals_from_store(path, ["TEMP"], cache, start=start, end=end)
+    times = loaded["TEMP"]["datetime"]
+    assert times.iloc[0] == start
+    assert times.iloc[-1] == end
+    assert len(times) == 11
+
+    # тот же результат без хранилища (чтение CSV)
+    _, from_csv, _ = load_archive_file(path, ["TEMP"], None, start, end)
+    np.testing.assert_array_equal(from_csv["TEMP"]["value"].to_numpy(), loaded["TEMP"]["value"].to_numpy())
+
+
+def test_csv_header(archive):
+    path, _, _ = archive
+    assert read_archive_header(path) == SIGNALS
+
+
+def test_csv_time_range(archive):
+    path, _, dt = archive
+    t_start, t_end = read_archive_time_range(path)
+    assert t_start == dt[0].value
+    assert t_end == dt[-1].value
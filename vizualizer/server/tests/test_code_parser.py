@@ -0,0 +1,204 @@
+# test_code_parser.py — парсер и компилятор CODE: эталонные значения на маленьком кадре
+#
+# Значения посчитаны исходным evaluator (regex + eval) и проверены вручную.
+# Индекс — минуты 0, 1, 2, 4, 5, 9: окна HISTORY* по времени содержат разное число точек.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from code_parser import CodeSyntaxError, parse_code, referenced_names
+from code_signal import (
+    NS_PER_MINUTE,
+    CodeEvaluationError,
+    code_input_names,
+    evaluate_code_expression,
+    register_tables,
+    rolling_slope,
+)
+
+
+SPECIAL = "10MAA50CP001§§XM20"
+nan = np.nan
+
+TABLES = {
+    "T": pd.DataFrame({"X": [0, 1, 2, 4], "Y": [0, 10, 15, 40]}),
+    "WAVE": pd.DataFrame({"X": [0, 1, 2, 3, 4], "Y": [0, 3, 1, 4, 2]}),
+    # X с десятичной запятой и повтором x = 2: слева — первая точка повтора, в точке и справа — последняя
+    "DUPS": pd.DataFrame({"a": ["3,0", "1", "2", "2", "5"], "b": [9, 1, 4, 6, 7]}),
+}
+
+GOLDEN = {
+    # операторы и приоритеты
+    "A + B * 2 - 3 / B": [3.5, -3.0, nan, 9.0, -4.5, 8.4],
+    "A % 2 + B ** 2 - -A": [6.0, -1.0, nan, 13.0, 1.25, 25.0],
+    "A = B * 0.5": [1, 0, 0, 0, 0, 0],
+    "A <> 1": [0, 1, 1, 1, 1, 1],
+    "(A > 0) + (B <= 2) + (A >= B) + (A < B)": [1, 1, 0, 1, 1, 1],
+    # логика
+    "(A > 0) AND (B < 3)": [1, 0, 0, 0, 1, 0],
+    "(A > 0) OR NOT (B >= 2)": [1, 1, 0, 1, 1, 0],
+    "(A > 0) & (B < 3) | (C > 0)": [1, 1, 0, 1, 1, 1],
+    "WHEN((A > 0) AND NOT (B > 4), B, -B)": [2.0, -1.0, -4.0, 3.0, 0.5, -5.0],
+    # имена, которые не разбираются общим правилом идентификатора
+    "C-1 * 2 + A": [21.0, 38.0, nan, 84.0, 100.5, 119.0],
+    "C-1 + C - 1": [9.0, 20.0, 29.0, 40.0, 49.0, 60.0],
+    f"{SPECIAL} / 2 + C-1": [10.25, 20.5, 30.75, 41.0, 51.25, 61.5],
+    f"HISTORYSUM('{SPECIAL}', 2)": [0.5, 1.5, 2.5, 2.0, 4.5, 3.0],
+    # PREV / HISTORY* (окно — минуты)
+    "PREV(A) + 1": [nan, 2.0, -1.0, nan, 5.0, 1.5],
+    "PREV(A + B)": [nan, 3.0, -1.0, nan, 7.0, 1.0],
+    "HISTORYAVG(B, 2)": [2.0, 1.5, 2.5, 3.0, 1.75, 5.0],
+    "HISTORYSUM(A, 3)": [1.0, -1.0, -1.0, 4.0, 4.5, -1.0],
+    "HISTORYCOUNT(A, 3)": [1, 2, 2, 1, 2, 1],
+    "HISTORYMAX(B, 3) - HISTORYMIN(B, 3)": [0.0, 1.0, 3.0, 1.0, 2.5, 0.0],
+    "HISTORYDIFF(A, 4)": [0.0, 3.0, 3.0, 6.0, 3.5, 0.0],
+    "HISTORYGRADIENT(C-1, 3)": [nan, 10.0, 10.0, 5.0, 10.0, nan],
+    "HISTORYGRADIENT(B, 2)": [nan, -1.0, 3.0, nan, -2.5, nan],
+    # функции
+    "ROUND(B / 3, 2)": [0.67, 0.33, 1.33, 1.0, 0.17, 1.67],
+    "ROUND(A * 1.25, C)": [1.0, -2.5, nan, 5.0, 1.0, -1.2],
+    "ROUND(C-1 * 1.5, -1)": [20.0, 30.0, 40.0, 60.0, 80.0, 90.0],
+    "MIN(A, B, 2) + MAX(A, B)": [3.0, -1.0, 6.0, 6.0, 1.0, 4.0],
+    "AVG(A, B) + MED(A, B, 1)": [2.5, 0.5, 6.5, 6.5, 1.0, 3.0],
+    "ABS(A) + POW(B, 2) + LOG10(C-1) + LOG(EXP(B))": [
+        8.0, 4.0 + np.log10(20), nan, 16.0 + np.log10(40), 1.25 + np.log10(50), 31.0 + np.log10(60),
+    ],
+    "np.pi * C": [0.0, np.pi, 0.0, np.pi, 0.0, np.pi],
+    # GETPOINT
+    "GETPOINT('T', B, 0, 'Y')": [15.0, 10.0, 40.0, 27.5, 5.0, 40.0],
+    "GETPOINT('T', 0, C-1, 'X')": [1.0, 2.4, 3.2, 4.0, 4.0, 4.0],
+    "GETPOINT(T, A, 0, Y)": [10.0, 0.0, nan, 40.0, 5.0, 0.0],
+    "GETPOINT('DUPS', B, 0, 'Y')": [6.0, 1.0, 8.0, 9.0, 1.0, 7.0],
+}
+
+# без временного индекса период HISTORY* — число точек
+GOLDEN_RANGE = {
+    "HISTORYSUM(A, 3)": [1.0, -1.0, -1.0, 2.0, 4.5, 3.5],
+    "HISTORYAVG(B, 2)": [2.0, 1.5, 2.5, 3.5, 1.75, 2.75],
+    "HISTORYGRADIENT(A, 3)": [nan, -3.0, -3.0, 6.0, -3.5, -2.5],
+    "HISTORYCOUNT(A, 2)": [1, 2, 1, 1, 2, 2],
+}
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    register_tables(TABLES)
+    yield
+    register_tables({})
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    minutes = [0, 1, 2, 4, 5, 9]
+    index = pd.DatetimeIndex(pd.Timestamp("2024-01-01") + pd.to_timedelta(minutes, unit="min")).as_unit("ns")
+    return pd.DataFrame(
+        {
+            "A": [1.0, -2.0, nan, 4.0, 0.5, -1.0],
+            "B": [2.0, 1.0, 4.0, 3.0, 0.5, 5.0],
+            "C": [0.0, 1.0, 0.0, 1.0, 0.0, 1.0],
+            "C-1": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+            SPECIAL: [0.5, 1.0, 1.5, 2.0, 2.5, 3.0],
+        },
+        index=index,
+    )
+
+
+@pytest.mark.parametrize("formula, expected", GOLDEN.items())
+def test_golden_values(formula, expected, frame):
+    actual, _ = evaluate_code_expression(formula, frame)
+    np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected, rtol=1e-12, atol=1e-12)
+    assert actual.index.equals(frame.index)
+
+
+@pytest.mark.parametrize("formula, expected", GOLDEN_RANGE.items())
+def test_golden_values_point_windows(formula, expected, frame):
+    frame = frame.reset_index(drop=True)
+    actual, _ = evaluate_code_expression(formula, frame)
+    np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_comparison_binds_tighter_than_logic(frame):
+    # в исходном evaluator AND/OR/NOT заменялись на & | ~ с приоритетом выше сравнений
+    actual, _ = evaluate_code_expression("NOT A > 0 AND B < 3 OR C = 0", frame)
+    a, b, c = frame["A"].to_numpy(), frame["B"].to_numpy(), frame["C"].to_numpy()
+    expected = (~(a > 0) & (b < 3)) | (c == 0)
+    np.testing.assert_array_equal(actual.to_numpy(dtype=bool), expected)
+
+
+def test_special_names_are_single_tokens():
+    tree = parse_code(f"C-1 + C - 1 + {SPECIAL}", ("C-1", SPECIAL))
+    assert referenced_names(tree) == ["C-1", "C", SPECIAL]
+    # без списка особых имён C-1 — это C минус 1
+    assert referenced_names(parse_code("C-1")) == ["C"]
+
+
+def test_code_input_names_include_string_literals():
+    names = code_input_names(f"HISTORYAVG('{SPECIAL}', 60) + C-1 + D", ["C-1", SPECIAL, "A"])
+    assert sorted(names) == sorted([SPECIAL, "C-1"])
+    assert code_input_names("A +", ["A"]) == []
+
+
+@pytest.mark.parametrize("formula", ["A +", "(A", "A B", "MAX(,)", "'abc"])
+def test_syntax_errors(formula, frame):
+    with pytest.raises(CodeSyntaxError):
+        parse_code(formula)
+    with pytest.raises(CodeEvaluationError):
+        evaluate_code_expression(formula, frame)
+
+
+def test_unknown_names_raise(frame):
+    with pytest.raises(CodeEvaluationError, match="not defined"):
+        evaluate_code_expression("A + nope", frame)
+    with pytest.raises(CodeEvaluationError, match="not defined"):
+        evaluate_code_expression("NOPE(A)", frame)
+
+
+def test_getpoint_warnings(frame):
+    result, warnings = evaluate_code_expression("GETPOINT('missing', A, 0, 'Y')", frame)
+    assert result.isna().all()
+    assert len(warnings) == 1
+
+    result, warnings = evaluate_code_expression(
+        "GETPOINT('WAVE', 0, A, 'X') + GETPOINT('WAVE', 0, B, 'X')", frame
+    )
+    assert warnings == ["GETPOINT: таблица 'WAVE' немонотонна — поиск X по Y неоднозначен."]
+
+
+@pytest.mark.parametrize("time_based", [True, False], ids=["minutes", "points"])
+def test_rolling_slope_precision_on_long_series(time_based):
+    # 10⁶ точек с шагом 1-3 минуты в 2024 году: x (минуты от эпохи) ~ 2.8e7,
+    # y ~ 1e6 с малыми приращениями — скользящие суммы по всему ряду здесь теряют знаки
+    n = 1_000_000
+    rng = np.random.default_rng(3)
+    times = pd.Timestamp("2024-01-01").value + np.cumsum(rng.integers(1, 4, size=n)) * NS_PER_MINUTE
+    y = 1e6 + np.cumsum(rng.normal(size=n)) * 1e-3
+    y[rng.random(n) < 0.05] = np.nan
+    values = pd.Series(y)
+    x = times / NS_PER_MINUTE if time_based else np.cumsum(~np.isnan(y))
+    period = 2
+
+    slope = rolling_slope(values, period, times if time_based else None)
+
+    # окно из двух соседних непустых точек: наклон в замкнутом виде
+    prev_valid = pd.Series(np.where(np.isnan(y), np.nan, np.arange(n))).ffill().shift().to_numpy()
+    two = ~np.isnan(y) & ~np.isnan(prev_valid)
+    j = prev_valid[two].astype(np.int64)
+    i = np.flatnonzero(two)
+    in_window = (times[i] - times[j] < period * NS_PER_MINUTE) if time_based else (i - j < period)
+    i, j = i[in_window], j[in_window]
+    expected = (y[i] - y[j]) / (x[i] - x[j])
+    np.testing.assert_allclose(slope[i], expected, rtol=1e-6, atol=1e-9)
+
+    # окна длиннее: выборочно против np.polyfit по точкам окна
+    period = 30
+    slope = rolling_slope(values, period, times if time_based else None)
+    for k in rng.integers(100, n, size=200):
+        if time_based:
+            window = np.arange(np.searchsorted(times, times[k] - period * NS_PER_MINUTE, side="right"), k + 1)
+        else:
+            window = np.arange(k - period + 1, k + 1)
+        window = window[~np.isnan(y[window])]
+        xs = x[window] - x[window[0]]
+        expected = np.polyfit(xs, y[window] - y[window[0]], 1)[0]
+        np.testing.assert_allclose(slope[k], expected, rtol=1e-6, atol=1e-9)
@@ -0,0 +1,118 @@
+# test_signal_index.py — индекс архива в SQLite: сканирование, запросы, повторное открытие
+
+import os
+
+import pandas as pd
+import pytest
+
+from archive_store import ARCHIVE_ENCODING
+from signal_index import QUERY_CHUNK, SignalIndex
+
+
+def write_csv(path, start: str, signals, rows: int = 4):
+    dt = pd.date_range(start, periods=rows, freq="1h")
+    lines = [";".join(["DATE", "TIME", *signals])]
+    for t in dt:
+        lines.append(";".join([t.strftime("%d.%m.%Y"), t.strftime("%H:%M:%S") + ",000", *(["1,5"] * len(signals))]))
+    with open(path, "w", encoding=ARCHIVE_ENCODING) as f:
+        f.write("\n".join(lines) + "\n")
+    return dt
+
+
+def bump_mtime(path):
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    folder = tmp_path / "archive"
+    folder.mkdir()
+    write_csv(folder / "jan.csv", "2024-01-01", ["A", "B", "C-1"])
+    write_csv(folder / "feb.csv", "2024-02-01", ["B", "C-1", "D§§1"])
+    (folder / "notes.txt").write_text("не CSV")
+    return str(folder), str(tmp_path / "index.sqlite")
+
+
+def test_sync_and_queries(archive):
+    folder, db_path = archive
+    index = SignalIndex(db_path, folder)
+    updated, removed = index.sync()
+    assert updated == ["feb.csv", "jan.csv"]
+    assert removed == []
+
+    assert len(index) == 4
+    assert list(index) == ["A", "B", "C-1", "D§§1"]
+    assert "C-1" in index and "nope" not in index
+    assert index.file_names() == ["feb.csv", "jan.csv"]
+
+    files = index.files_for(["B", "A", "nope"])
+    assert list(files) == [os.path.join(folder, "feb.csv"), os.path.join(folder, "jan.csv")]
+    assert {path: sorted(names) for path, names in files.items()} == {
+        os.path.join(folder, "feb.csv"): ["B"],
+        os.path.join(folder, "jan.csv"): ["A", "B"],
+    }
+
+    # окно по времени отсекает файлы без пересечения
+    feb = pd.Timestamp("2024-02-01 01:00").value
+    assert list(index.files_for(["B"], start_ns=feb)) == [os.path.join(folder, "feb.csv")]
+    assert list(index.files_for(["B"], end_ns=feb - 10**15)) == [os.path.join(folder, "jan.csv")]
+    index.close()
+
+
+def test_reopen_keeps_index_and_rescans_only_changes(archive):
+    folder, db_path = archive
+    index = SignalIndex(db_path, folder)
+    index.sync()
+    fingerprints = index.fingerprints(["A", "B"])
+    index.close()
+
+    index = SignalIndex(db_path, folder)
+    assert index.sync() == ([], [])
+    assert len(index) == 4
+    assert index.fingerprints(["A", "B"]) == fingerprints
+
+    write_csv(os.path.join(folder, "jan.csv"), "2024-01-01", ["A", "E"])
+    bump_mtime(os.path.join(folder, "jan.csv"))
+    os.remove(os.path.join(folder, "feb.csv"))
+    assert index.sync() == (["jan.csv"], ["feb.csv"])
+    assert list(index) == ["A", "E"]
+    new_fingerprints = index.fingerprints(["A", "B"])
+    assert list(new_fingerprints) == ["A"]
+    assert new_fingerprints["A"] != fingerprints["A"]
+    index.close()
+
+
+def test_failed_files_are_not_rescanned(archive, capsys):
+    folder, db_path = archive
+    broken = os.path.join(folder, "broken.csv")
+    with open(broken, "wb") as f:
+        f.write(b"DATE;TIME;X\n\x00garbage")
+    index = SignalIndex(db_path, folder)
+    updated, _ = index.sync()
+    assert "broken.csv" not in updated
+    assert "broken.csv" not in index.file_names()
+    assert "Failed to index broken.csv" in capsys.readouterr().out
+
+    # без изменений файл повторно не читается
+    assert index.sync() == ([], [])
+    assert "broken.csv" not in capsys.readouterr().out
+
+    write_csv(broken, "2024-03-01", ["X"])
+    bump_mtime(broken)
+    assert index.sync() == (["broken.csv"], [])
+    assert "X" in index
+    index.close()
+
+
+def test_files_for_many_names(archive):
+    folder, db_path = archive
+    index = SignalIndex(db_path, folder)
+    index.sync()
+    names = [f"S{i}" for i in range(QUERY_CHUNK * 3)] + ["D§§1", "A"]
+    files = index.files_for(names)
+    assert files == {
+        os.path.join(folder, "feb.csv"): ["D§§1"],
+        os.path.join(folder, "jan.csv"): ["A"],
+    }
+    index.close()
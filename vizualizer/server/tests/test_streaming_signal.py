@@ -0,0 +1,172 @@
+# test_streaming_signal.py — потоковый расчёт самоссылающихся сигналов
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from code_signal import CodeEvaluationError, evaluate_code_expression, register_tables, rolling_slope
+from streaming_signal import RingAggregate, compute_streaming_signal
+
+
+def irregular_index(n: int) -> pd.DatetimeIndex:
+    """Нерегулярные метки времени: окно HISTORY* в потоке — N точек, а не N минут"""
+    steps = np.random.default_rng(1).integers(10, 400, size=n)
+    return pd.DatetimeIndex(pd.Timestamp("2024-01-01") + pd.to_timedelta(np.cumsum(steps), unit="s")).as_unit("ns")
+
+
+@pytest.mark.parametrize("func", ["HISTORYAVG", "HISTORYSUM", "HISTORYMAX", "HISTORYMIN", "HISTORYDIFF", "HISTORYGRADIENT"])
+def test_ring_aggregate_matches_rolling(func):
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=500) * 1e3 + 1e6
+    values[rng.random(500) < 0.2] = np.nan
+    period = 17
+    ring = RingAggregate(func, period)
+    actual = []
+    for value in values:
+        ring.push(value)
+        actual.append(ring.value())
+
+    series = pd.Series(values)
+    if func == "HISTORYGRADIENT":
+        expected = rolling_slope(series, period)
+    else:
+        rolling = series.rolling(period, min_periods=1)
+        expected = {
+            "HISTORYAVG": rolling.mean(),
+            "HISTORYSUM": rolling.sum(),
+            "HISTORYMAX": rolling.max(),
+            "HISTORYMIN": rolling.min(),
+            "HISTORYDIFF": rolling.max() - rolling.min(),
+        }[func].to_numpy()
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-6)
+
+
+def test_ring_aggregate_window():
+    ring = RingAggregate("HISTORYCOUNT", 3)
+    assert np.isnan(ring.value())
+    for value in [1.0, np.nan, 2.0, 3.0]:
+        ring.push(value)
+    # NaN занимает место в окне, но не считается
+    assert ring.value() == 2.0
+    ring.push(np.nan)
+    ring.push(np.nan)
+    ring.push(np.nan)
+    assert np.isnan(ring.value())
+
+
+@pytest.mark.parametrize("index", [pd.RangeIndex(6), irregular_index(6)], ids=["range", "datetime"])
+def test_history_self_window(index):
+    df = pd.DataFrame({"A": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]}, index=index)
+    # окно self — N предыдущих значений сигнала
+    formula = "WHEN(HISTORYCOUNT(S, 2) > 0, HISTORYSUM(S, 2), 0) + 1"
+    actual = compute_streaming_signal(formula, df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), [1, 2, 4, 7, 12, 20])
+    assert actual.index.equals(index)
+    assert actual.name == "S"
+
+    formula = "WHEN(PREV(S) > 0, HISTORYMAX(S, 3) - HISTORYMIN(S, 3), 0) + A"
+    np.testing.assert_array_equal(compute_streaming_signal(formula, df, "S").to_numpy(), [1, 2, 4, 7, 10, 12])
+
+
+# формулы без HISTORY*(self|expr): результат должен совпадать с пакетным
+# расчётом формулы заново на каждом префиксе (исходный потоковый алгоритм)
+FORMULAS = [
+    "PREV(S) + 1",
+    "HISTORYSUM(A, 5) + PREV(S) * 0.5",
+    "HISTORYAVG(A, 4) * 2 + 0 * PREV(S)",
+    "HISTORYCOUNT(A, 4) + HISTORYDIFF(B, 5) + HISTORYMIN(B, 3) + PREV(S) * 0.1",
+    "HISTORYGRADIENT(A, 6) + HISTORYGRADIENT(B, 7) + B",
+    "HISTORYCOUNT(A, 4) + WHEN(PREV(S) > 0, ROUND(PREV(S) * 0.5 + 1, 2), 0)",
+    "GETPOINT('T', B, 0, 'Y') + WHEN(PREV(S) > 20, -1, 1)",
+    "WHEN((A > 0) AND NOT (PREV(S) > 3), PREV(S) + 1, 0)",
+    "MAX(A, PREV(S) / 2, B - 3) + ABS(MIN(A, B))",
+]
+
+
+def reference_forward(formula: str, df: pd.DataFrame, name: str) -> np.ndarray:
+    """На каждом шаге формула считается пакетно по префиксу (окна HISTORY* по точкам)"""
+    df = df.reset_index(drop=True)
+    result = pd.Series(np.nan, index=df.index)
+    for i in range(len(df)):
+        current = df.iloc[: i + 1].copy()
+        current[name] = result.iloc[:i].reindex(current.index)
+        series, _ = evaluate_code_expression(formula, current)
+        result.iat[i] = series.iloc[-1]
+    return result.to_numpy(dtype=np.float64)
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    register_tables({"T": pd.DataFrame({"X": [0, 1, 2, 4], "Y": [0, 10, 15, 40]})})
+    yield
+    register_tables({})
+
+
+@pytest.fixture(params=["datetime", "range"])
+def frame(request) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    n = 80
+    index = irregular_index(n) if request.param == "datetime" else pd.RangeIndex(n)
+    a = rng.normal(size=n)
+    a[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({"A": a, "B": rng.normal(size=n) + 3}, index=index)
+
+
+@pytest.mark.parametrize("formula", FORMULAS)
+def test_matches_forward_evaluation(formula, frame):
+    actual = compute_streaming_signal(formula, frame, "S")
+    expected = reference_forward(formula, frame, "S")
+    np.testing.assert_allclose(actual.to_numpy(), expected, rtol=1e-7, atol=1e-9)
+
+
+def test_formula_without_self_matches_batch():
+    df = pd.DataFrame({"A": [1.0, np.nan, 3.0, 4.0], "B": [0.5, 1.5, 3.0, 9.0]})
+    formula = "HISTORYAVG(A, 2) + GETPOINT('T', B, 0, 'Y')"
+    expected, _ = evaluate_code_expression(formula, df)
+    actual = compute_streaming_signal(formula, df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+    np.testing.assert_array_equal(actual.to_numpy(), [6.0, 13.5, 30.5, 43.5])
+
+
+def test_nan_truthiness_matches_batch():
+    # NaN в условии — истина в обоих режимах (как astype(bool)), ложь только 0
+    df = pd.DataFrame({"A": [np.nan, 0.0, 1.0, np.nan, 0.0], "B": [1.0, np.nan, np.nan, 0.0, 0.0]})
+    logic = "WHEN(A AND B, 1, 0) + WHEN(A OR B, 10, 0) + WHEN(NOT A, 100, 0) + WHEN(A, 1000, 0)"
+    expected, _ = evaluate_code_expression(logic, df)
+    np.testing.assert_array_equal(expected.to_numpy(), [1011, 110, 1011, 1010, 100])
+    actual = compute_streaming_signal(logic + " + WHEN(PREV(S) > 0, 0, 0)", df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize("formula, message", [
+    ("PREV(S, 1)", "PREV"),
+    ("HISTORYAVG(S)", "HISTORYAVG"),
+    ("HISTORYAVG(S, 0)", "период"),
+    ("S + nope", "not defined"),
+    ("S +", "Неожиданный конец"),
+])
+def test_errors(formula, message, frame):
+    with pytest.raises(CodeEvaluationError, match=message):
+        compute_streaming_signal(formula, frame, "S")
+
+
+@pytest.mark.parametrize("index", [pd.RangeIndex(5), irregular_index(5)], ids=["range", "datetime"])
+def test_history_and_prev_of_expressions(index):
+    df = pd.DataFrame({"A": [1.0, 2.0, 3.0, 4.0, 5.0], "B": [2.0, 0.0, 1.0, 3.0, 1.0]}, index=index)
+
+    # expr без self: текущий шаг входит в окно, как у HISTORY*(other)
+    actual = compute_streaming_signal("HISTORYSUM(A * 2, 2) + WHEN(PREV(S) > 0, 0, 0)", df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), [2, 6, 10, 14, 18])
+
+    actual = compute_streaming_signal("WHEN(PREV(S) > 0, PREV(A * B), 1)", df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), [1, 2, 0, 1, 12])
+
+    # expr с self: окно состоит из предыдущих шагов
+    formula = "WHEN(HISTORYCOUNT(S + A, 2) > 0, HISTORYMAX(S + A, 2), 0) + A"
+    actual = compute_streaming_signal(formula, df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), [1, 4, 9, 16, 25])
+
+    # вложенные PREV(HISTORY*(...))
+    formula = "WHEN(PREV(HISTORYSUM(S - A, 2)) > 0, PREV(HISTORYSUM(S - A, 2)), 1) + A"
+    actual = compute_streaming_signal(formula, df, "S")
+    np.testing.assert_array_equal(actual.to_numpy(), [2, 3, 4, 6, 7])
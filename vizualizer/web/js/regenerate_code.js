@@ -51,6 +51,8 @@ const utilsCode = `
       expr = expr.replace(/([A-Za-z_]\\w*)\\s*\\(([^()]|\\([^()]*\\))*\\)/g, (match, name) => {
         const tpl = templatesMap[name];
         if (!tpl) return match;
+        // native: вычисляется встроенной функцией сервера (iapws97.py) — не разворачиваем
+        if (tpl.native) return match;
 
         const open = match.indexOf('(');
         const close = match.lastIndexOf(')');
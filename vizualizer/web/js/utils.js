@@ -264,6 +264,8 @@ function expandFormulaTemplates(expr, templatesMap) {
         expr = expr.replace(/([A-Za-z_]\w*)\s*\(([^()]|\([^()]*\))*\)/g, (match, name) => {
             const tpl = templatesMap[name];
             if (!tpl) return match;
+            // native: вычисляется встроенной функцией сервера (iapws97.py) — не разворачиваем
+            if (tpl.native) return match;
 
             // 1. Извлекаем аргументы из вызова: h(10, 20, 30) -> ["10", "20", "30"]
             const open = match.indexOf('(');